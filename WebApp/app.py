@@ -1,65 +1,184 @@
-import flask
-import pickle
-from tensorflow.keras import models
-from custom_utility import predict as predictModule
+import os
+import json
+from custom_utility import startup
+
+# Time the import of the web app modules, which is mostly the import of TensorFlow.
+with startup.phase('imports'):
+
+    import flask
+    import pandas as pd
+    from custom_utility import predict as predictModule
+    from custom_utility import preprocess_text
+    from custom_utility import preprocess_cache
+    from custom_utility import batching
+    from custom_utility import prediction_cache
+    from custom_utility import instrumentation
+    from custom_utility import registry
 
 app = flask.Flask(__name__)
 
-# File location having the tokenizer object trained on the training data.
-tokenizerObjFile = 'Resources/tokenizer.pkl'
+# Record the time taken by each stage of the pre-processing if enabled through the environment variable.
+if os.environ.get('PREPROCESS_INSTRUMENTATION') == '1':
 
-# File location having the pre-trained model.
-modelFile = 'BestModels/modelBiLSTM.h5'
+    preprocess_text.setInstrumentation(True)
 
-# Reference: https://github.com/nidhibansal1902/Jigsaw-Unintended-Bias-in-Toxicity-Classification/blob/master/Jigsaw-LSTM%20with%20Glove%20Embedding%20New.ipynb
-def customLoss(yActual, yPred):
+# File location having the tokenizer object trained on the training data. It can be pointed to the memory-mappable
+# vocabulary exported from it (see 'vocabulary.py'), which is shared by all the worker processes.
+tokenizerObjFile = os.environ.get('TOKENIZER_FILE', 'Resources/tokenizer.pkl')
+
+# Backend running the pre-trained model (keras, tflite, onnx or shared, see 'predict.loadPredictor()') and the file
+# location of the model for it, like the inference-only model exported by 'export_model.py', the TensorFlow Lite model
+# converted by 'quantize.py', the ONNX model exported by 'export_model.py --onnx' or the manifest exported by
+# 'export_model.py --shared', whose memory-mapped embedding matrix is shared by all the worker processes.
+toxicityBackend = os.environ.get('TOXICITY_BACKEND', 'keras')
+modelFile = os.environ.get('MODEL_FILE', 'BestModels/modelBiLSTM.h5')
+
+# Maximum number of comments in a request of the JSON API, answered at once or streamed as NDJSON, and the number of
+# comments scored at a time while streaming.
+apiMaxBatchSize = int(os.environ.get('API_MAX_BATCH_SIZE', 1000))
+apiMaxStreamSize = int(os.environ.get('API_MAX_STREAM_SIZE', 100000))
+apiStreamChunkSize = int(os.environ.get('API_STREAM_CHUNK_SIZE', 256))
+
+# Pre-trained objects, loaded once per process by 'loadPretrainedObj()'.
+tokenizer = None
+runner = None
+predictionCache = None
+
+# In the preload mode of gunicorn (see 'gunicorn.conf.py'), the app is loaded once before forking the workers, which
+# share its pages copy-on-write. The model is then loaded in each worker after forking, unless its backend is fork-safe.
+preloadMode = os.environ.get('PRELOAD_APP') == '1'
+
+def loadPretrainedObj(loadModel=True):
     '''
-    Function to calculate loss for the toxic class label.
-    
+    Function to load the pre-trained objects like tokenizer and model, each only once, and warm them up once all of them
+    are loaded.
+
     Parameters:
-    -----------
-    yActual: array-like
-        Actual Class Labels.
-    yPred: array-like
-        Predicted Class Labels.
+    ----------
+    loadModel: boolean
+        Flag to check whether to load the model, or only the tokenizer (before forking the workers).
     '''
-    
-    return binary_crossentropy(backend.reshape(yActual[:, 0], (-1, 1)), yPred) * yActual[:, 1]
 
-def loadPretrainedObj():
-    '''
-    Function to load the pre-trained objects like tokenizer and model.
-    '''
+    global tokenizer, runner, predictionCache
+
     # region: Load Tokenizer
 
-    # Load the tokenizer object
-    with open(tokenizerObjFile, 'rb') as f:
-        
-        tokenizer = pickle.load(f)
+    if tokenizer is None:
+
+        with startup.phase('loadTokenizer'):
+
+            # Get the tokenizer object from the process-wide registry (unpickled only once).
+            tokenizer = registry.loadTokenizer(tokenizerObjFile)
 
     # endregion: Load Tokenizer
 
     # region: Load Pre-trained Model
 
-    # Load the tokenizer object
-    model = models.load_model(modelFile, custom_objects={'customLoss': customLoss})
+    if loadModel == True and runner is None:
+
+        with startup.phase('loadModel'):
+
+            # Load the backend running the pre-trained model. The Keras model is traced and warmed up so that each
+            # request is scored without going through 'model.predict()'.
+            runner = predictModule.loadPredictor(toxicityBackend, modelFile,
+                                                 numThreads=int(os.environ['TOXICITY_THREADS'])
+                                                 if os.environ.get('TOXICITY_THREADS') else None)
+
+            # Cache of the predictions of this version of the model, bounded through the environment variables.
+            # A TTL of zero keeps the entries until they are evicted.
+            cacheSize = int(os.environ.get('PREDICTION_CACHE_SIZE', 100000))
+            ttlSeconds = float(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+            predictionCache = prediction_cache.PredictionCache(prediction_cache.modelVersion(runner), maxSize=cacheSize,
+                                                               ttlSeconds=ttlSeconds if ttlSeconds > 0 else None)
+
+        # Run the whole scoring path once, so that the first request is as fast as the others.
+        startup.warmUp(scoreComments)
+        startup.markReady()
+
+        # Report the memory of the worker once ready: its pages shared with the other workers (like the memory-mapped
+        # embedding matrix) count in full in its RSS, but only for their share in its PSS.
+        print(startup.readyReport(), flush=True)
 
     # endregion: Load Pre-trained Model
 
-# Load the tokenizer object
-with open(tokenizerObjFile, 'rb') as f:
-    
-    tokenizer = pickle.load(f)
+def scoreComments(comments):
+    '''
+    Function to predict the toxicity of a batch of comments in a single call of 'function1()'.
+
+    Parameters:
+    -----------
+    comments: list
+        List of the comment texts.
+    '''
+
+    toxicityResult = predictModule.function1(pd.Series(comments), tokenizerObj=tokenizer, model=runner)
+
+    return [{'isToxic': isToxic, 'toxicityScore': toxicityScore}
+            for isToxic, toxicityScore in zip(toxicityResult['Toxic'], toxicityResult['Probability'])]
+
+def scoreRecords(ids, comments):
+    '''
+    Function to predict the toxicity of a batch of comments in a single call of 'function1()', as the records returned by
+    the JSON API.
+
+    Parameters:
+    -----------
+    ids: list
+        List of the ids of the comments.
+    comments: list
+        List of the comment texts.
+    '''
+
+    return [{'id': commentId, 'isToxic': result['isToxic'], 'toxicityScore': float(result['toxicityScore'])}
+            for commentId, result in zip(ids, scoreComments(comments))]
+
+def parseScoreRequest(payload):
+    '''
+    Function to get the ids and texts of the comments of a request of the JSON API. The comments are given either as
+    texts or as objects with a 'comment' text and an optional 'id' (defaulting to the position of the comment), in a
+    list or in the 'comments' field of an object.
+
+    Parameters:
+    -----------
+    payload: dict or list
+        Decoded JSON body of the request.
+    '''
+
+    comments = payload.get('comments') if isinstance(payload, dict) else payload
+
+    if not isinstance(comments, list) or len(comments) == 0:
+
+        raise ValueError('The request must hold a non-empty list of comments.')
+
+    ids, texts = [], []
+
+    for position, comment in enumerate(comments):
+
+        if isinstance(comment, dict):
+
+            ids.append(comment.get('id', position))
+            comment = comment.get('comment')
+
+        else:
 
-# endregion: Load Tokenizer
+            ids.append(position)
 
-# region: Load Pre-trained Model
+        if not isinstance(comment, str):
 
-# Load the tokenizer object
-model = models.load_model(modelFile, custom_objects={'customLoss': customLoss})
+            raise ValueError('The comment at position {} is not a text.'.format(position))
 
-# Call the function 'loadPretrainedObj()' to load the tokenizer and pre-trained model.
-loadPretrainedObj()
+        texts.append(comment)
+
+    return ids, texts
+
+# Call the function 'loadPretrainedObj()' to load the tokenizer and pre-trained model. In preload mode, a model which
+# cannot be shared by forking is loaded by the 'post_fork' hook of gunicorn instead.
+loadPretrainedObj(loadModel=not preloadMode or startup.isForkSafe(toxicityBackend))
+
+# Coalesce the comments posted concurrently into batches scored together. The batch size and the maximum time a comment
+# waits for the others can be tuned through the environment variables.
+batcher = batching.MicroBatcher(scoreComments, maxBatchSize=int(os.environ.get('BATCH_MAX_SIZE', 32)),
+                                maxWaitSeconds=float(os.environ.get('BATCH_MAX_WAIT_MS', 5)) / 1000)
 
 @app.route('/')
 @app.route('/index', methods=['GET'])
@@ -77,6 +196,34 @@ def fallback(e):
 
     return flask.render_template('error.html')
 
+def statsReport(batchingStats):
+    '''
+    Function to return the statistics of the web app, with the given statistics of the component batching the comments
+    of the form (the 'MicroBatcher' of the WSGI app, or the 'AsyncScorer' of the ASGI app).
+
+    Parameters:
+    ----------
+    batchingStats: dict
+        Queue depth, batch sizes and wait time of the batching.
+    '''
+
+    # Export the per-stage pre-processing statistics (empty unless enabled), the pre-processing cache counters, the
+    # load time and memory footprint of the tokenizer, the queue depth, batch sizes and wait time of the batching, the
+    # hit rate and saved compute time of the prediction cache and the time taken by each phase of the startup.
+    return {
+        'preprocessStages': instrumentation.getStats(),
+        'preprocessCache': preprocess_cache.stats(),
+        'tokenizers': registry.stats(),
+        'batching': batchingStats,
+        'predictionCache': predictionCache.stats() if predictionCache is not None else None,
+        'startup': startup.stats()
+    }
+
+@app.route('/stats', methods=['GET'])
+def stats():
+
+    return flask.jsonify(statsReport(batcher.stats()))
+
 @app.route('/predict', methods=['GET', 'POST'])
 def predict():
 
@@ -85,16 +232,51 @@ def predict():
         # Fetch the input text.
         comment = flask.request.form['comment']
 
-        # Call the function 'function1()' from the 'predict' module of the package 'custom_utility' to predict the toxicity.
-        toxicityResult = predictModule.function1(comment, tokenizerObj=tokenizer, model=model)
-
-        toxicityResult = {
-            'isToxic': toxicityResult.iloc[0]['Toxic'],
-            'toxicityScore': toxicityResult.iloc[0]['Probability']
-        }
+        # Predict the toxicity of the comment along with the comments posted concurrently, through the function
+        # 'function1()' from the 'predict' module of the package 'custom_utility', unless the same comment (once
+        # pre-processed) is cached or being predicted for another request.
+        toxicityResult = predictionCache.get(comment, batcher.submit)
 
     return flask.render_template('index.html', toxicity=toxicityResult)
 
+@app.route('/api/v1/score', methods=['POST'])
+def scoreAPI():
+
+    # Stream the records as NDJSON (one JSON record per line) if asked for, so that large batches are answered while
+    # they are scored.
+    stream = (flask.request.args.get('stream') in ('1', 'true') or
+              flask.request.accept_mimetypes.best == 'application/x-ndjson')
+
+    try:
+
+        ids, texts = parseScoreRequest(flask.request.get_json(silent=True))
+
+    except ValueError as error:
+
+        return flask.jsonify({'error': str(error)}), 400
+
+    maxBatchSize = apiMaxStreamSize if stream == True else apiMaxBatchSize
+
+    if len(texts) > maxBatchSize:
+
+        return flask.jsonify({'error': 'The request holds {} comments, the maximum is {}.'.format(len(texts),
+                                                                                                  maxBatchSize)}), 413
+
+    if stream == False:
+
+        # Predict the toxicity of all the comments in a single pass.
+        return flask.jsonify({'results': scoreRecords(ids, texts)})
+
+    def generateRecords():
+
+        for start in range(0, len(texts), apiStreamChunkSize):
+
+            for record in scoreRecords(ids[start:start + apiStreamChunkSize], texts[start:start + apiStreamChunkSize]):
+
+                yield json.dumps(record) + '\n'
+
+    return flask.Response(generateRecords(), mimetype='application/x-ndjson')
+
 
     
 
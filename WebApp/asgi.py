@@ -0,0 +1,474 @@
+import io
+import os
+import json
+import time
+import asyncio
+import collections
+import multiprocessing
+import urllib.parse
+from concurrent import futures
+import tensorflow as tf
+from werkzeug import formparser, http
+
+# Number of processes pre-processing the comments. The model is run by a single thread, so TensorFlow runs one operation
+# at a time (inter-op) over the cores left by the pre-processing (intra-op). The threads can only be set before the
+# TensorFlow runtime is initialized, so before importing the app (which loads the model).
+cpuCount = os.cpu_count() or 1
+preprocessWorkers = int(os.environ.get('ASYNC_PREPROCESS_WORKERS', max(1, cpuCount // 4)))
+tf.config.threading.set_intra_op_parallelism_threads(int(os.environ.get('TF_INTRA_OP_THREADS',
+                                                                        max(1, cpuCount - preprocessWorkers))))
+tf.config.threading.set_inter_op_parallelism_threads(int(os.environ.get('TF_INTER_OP_THREADS', 1)))
+
+import flask
+from asgiref.wsgi import WsgiToAsgi
+import app as flaskApp
+from custom_utility import predict as predictModule
+from custom_utility import preprocess_batch
+from custom_utility import startup
+
+class AsyncScorer:
+    '''
+    Scorer of the comments for the event loop of the async server. The comments are pre-processed in a process pool and
+    scored by a single dedicated inference thread, so that neither blocks the event loop. The single comments of the
+    form are coalesced into batches (like the 'MicroBatcher' of the WSGI app) and looked up in the prediction cache of
+    the app, concurrent requests for the same comment waiting for a single prediction.
+
+    Parameters:
+    ----------
+    preprocessWorkers: int
+        Number of processes pre-processing the comments.
+    maxBatchSize: int
+        Maximum number of comments of the form in a batch.
+    maxWaitSeconds: float
+        Maximum time a comment of the form waits for the other comments to join its batch.
+    chunkSize: int
+        Number of comments sent to a pre-processing process at a time.
+    '''
+
+    def __init__(self, preprocessWorkers, maxBatchSize=32, maxWaitSeconds=0.005, chunkSize=256):
+
+        # The pre-processing processes are spawned instead of forked, so that they do not inherit the TensorFlow runtime.
+        self.processPool = futures.ProcessPoolExecutor(max_workers=preprocessWorkers,
+                                                       mp_context=multiprocessing.get_context('spawn'))
+        self.preprocessWorkers = preprocessWorkers
+        self.inferenceExecutor = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+        self.maxBatchSize = maxBatchSize
+        self.maxWaitSeconds = maxWaitSeconds
+        self.chunkSize = chunkSize
+        self._queue = None
+        self._inFlight = dict()
+
+        # Counters of the batching, only updated and read on the event loop.
+        self._batchSizes = collections.Counter()
+        self._requests = self._coalesced = 0
+        self._totalWaitSeconds = self._maxWaitSeconds = self._totalScoreSeconds = 0.0
+
+    async def preprocess(self, texts):
+        '''
+        Function to pre-process the texts over the process pool, returning them in the same order.
+
+        Parameters:
+        ----------
+        texts: list
+            Raw comment texts.
+        '''
+
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*[loop.run_in_executor(self.processPool, preprocess_batch._preprocessTexts,
+                                                             chunk, {})
+                                        for chunk in preprocess_batch._splitIntoChunks(texts, self.chunkSize)])
+
+        return [preprocessedText for chunk in chunks for preprocessedText in chunk]
+
+    async def score(self, preprocessedTexts):
+        '''
+        Function to predict the toxicity of the pre-processed texts in the inference thread.
+
+        Parameters:
+        ----------
+        preprocessedTexts: list
+            Pre-processed comment texts.
+        '''
+
+        yPredProb = await asyncio.get_running_loop().run_in_executor(self.inferenceExecutor,
+                                                                     predictModule.scorePreprocessed, preprocessedTexts,
+                                                                     flaskApp.tokenizer, flaskApp.runner)
+
+        return [{'isToxic': 'Yes' if prob >= 0.5 else 'No', 'toxicityScore': float(prob)} for prob in yPredProb]
+
+    async def _run(self):
+        '''
+        Function to score the batches of the comments of the form one after the other, run as a task of the event loop.
+        The comments arriving while a batch is scored form the next batch.
+        '''
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.maxWaitSeconds
+
+            while len(batch) < self.maxBatchSize:
+
+                remaining = deadline - loop.time()
+
+                try:
+
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining) if remaining > 0
+                                 else self._queue.get_nowait())
+
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+
+                    break
+
+            start = time.perf_counter()
+
+            try:
+
+                results = await self.score([preprocessedText for preprocessedText, _, _ in batch])
+
+            except Exception as error:
+
+                results = None
+
+                for _, future, _ in batch:
+
+                    if not future.done():
+
+                        future.set_exception(error)
+
+            self._recordBatch(batch, start, time.perf_counter())
+
+            if results is None:
+
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+
+                if not future.done():
+
+                    future.set_result(result)
+
+    async def _submit(self, preprocessedText):
+        '''
+        Function to add a pre-processed text to the next batch and wait for its prediction.
+        '''
+
+        loop = asyncio.get_running_loop()
+
+        # The queue and its task belong to the running event loop, so they are created with the first comment.
+        if self._queue is None:
+
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+        future = loop.create_future()
+        self._queue.put_nowait((preprocessedText, future, time.perf_counter()))
+
+        return await future
+
+    def _recordBatch(self, batch, start, end):
+        '''
+        Function to count a scored batch, the time its comments waited in the queue and the time taken to score it.
+        '''
+
+        self._batchSizes[len(batch)] += 1
+        self._requests += len(batch)
+        self._totalScoreSeconds += end - start
+
+        for _, _, enqueuedAt in batch:
+
+            waitSeconds = start - enqueuedAt
+            self._totalWaitSeconds += waitSeconds
+            self._maxWaitSeconds = max(self._maxWaitSeconds, waitSeconds)
+
+    async def scoreComment(self, comment):
+        '''
+        Function to predict the toxicity of a comment of the form, unless the same comment (once pre-processed) is cached
+        or being predicted for another request.
+
+        Parameters:
+        ----------
+        comment: str
+            Raw comment text.
+        '''
+
+        preprocessedText = (await self.preprocess([comment]))[0]
+        cache = flaskApp.predictionCache
+        key = cache.key(preprocessedText)
+        result = cache.lookup(key)
+
+        if result is not None:
+
+            return result
+
+        inFlight = self._inFlight.get(key)
+        isOwner = inFlight is None
+
+        if isOwner == True:
+
+            # The prediction runs as its own task, so that it is not cancelled with the request that started it.
+            inFlight = asyncio.get_running_loop().create_task(self._predict(key, preprocessedText))
+            self._inFlight[key] = inFlight
+
+            # The error is marked as retrieved, in case all the requests waiting for it are gone.
+            inFlight.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+        # Shielded, so that a client disconnecting (even the one that started the prediction) does not cancel the
+        # prediction of the others.
+        result, computeSeconds = await asyncio.shield(inFlight)
+
+        if isOwner == False:
+
+            self._coalesced += 1
+            cache.recordCoalesced(computeSeconds)
+
+        return dict(result)
+
+    async def _predict(self, key, preprocessedText):
+        '''
+        Function to predict the toxicity of a pre-processed comment and cache it, returning the prediction and the time it
+        took. The errors are raised to all the requests waiting for it, and are not cached.
+        '''
+
+        start = time.perf_counter()
+
+        try:
+
+            result = await self._submit(preprocessedText)
+            computeSeconds = time.perf_counter() - start
+            flaskApp.predictionCache.store(key, result, computeSeconds)
+
+            return result, computeSeconds
+
+        finally:
+
+            del self._inFlight[key]
+
+    def stats(self):
+        '''
+        Function to return the queue depth, batch size distribution, wait time and scoring time of the batches of the
+        comments of the form, with the same fields as the 'stats()' of the 'MicroBatcher', along with the number of
+        comments being predicted and of the requests which waited for the prediction of another request.
+        '''
+
+        batches = sum(self._batchSizes.values())
+
+        return {
+            'queueDepth': self._queue.qsize() if self._queue is not None else 0,
+            'maxBatchSize': self.maxBatchSize,
+            'maxWaitMilliseconds': 1e3 * self.maxWaitSeconds,
+            'batches': batches,
+            'requests': self._requests,
+            'batchSizes': dict(sorted(self._batchSizes.items())),
+            'meanBatchSize': self._requests / batches if batches else 0.0,
+            'meanWaitMilliseconds': 1e3 * self._totalWaitSeconds / self._requests if self._requests else 0.0,
+            'maxObservedWaitMilliseconds': 1e3 * self._maxWaitSeconds,
+            'meanScoreMilliseconds': 1e3 * self._totalScoreSeconds / batches if batches else 0.0,
+            'inFlight': len(self._inFlight),
+            'coalesced': self._coalesced,
+            'preprocessWorkers': self.preprocessWorkers
+        }
+
+    def shutdown(self):
+        '''
+        Function to stop the pre-processing processes and the inference thread.
+        '''
+
+        self.processPool.shutdown(cancel_futures=True)
+        self.inferenceExecutor.shutdown(cancel_futures=True)
+
+
+scorer = AsyncScorer(preprocessWorkers, maxBatchSize=int(os.environ.get('BATCH_MAX_SIZE', 32)),
+                     maxWaitSeconds=float(os.environ.get('BATCH_MAX_WAIT_MS', 5)) / 1000)
+
+# The other routes (pages, static files) are served by the Flask app, in threads of the event loop.
+wsgiApplication = WsgiToAsgi(flaskApp.app)
+
+async def readBody(receive):
+    '''
+    Function to read the whole body of a request.
+
+    Parameters:
+    ----------
+    receive: function
+        ASGI function receiving the messages of the request.
+    '''
+
+    body = bytearray()
+    moreBody = True
+
+    while moreBody == True:
+
+        message = await receive()
+        body += message.get('body', b'')
+        moreBody = message.get('more_body', False)
+
+    return bytes(body)
+
+async def sendResponse(send, status, body, contentType):
+    '''
+    Function to send a whole response.
+
+    Parameters:
+    ----------
+    send: function
+        ASGI function sending the messages of the response.
+    status: int
+        HTTP status code.
+    body: bytes
+        Body of the response.
+    contentType: str
+        Content type of the body.
+    '''
+
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', contentType.encode('latin-1')),
+                            (b'content-length', str(len(body)).encode('latin-1'))]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def sendJSON(send, status, payload):
+    '''
+    Function to send a whole JSON response.
+    '''
+
+    await sendResponse(send, status, json.dumps(payload).encode('utf-8'), 'application/json')
+
+async def predictRoute(scope, receive, send, headers):
+
+    # Parse the form (url-encoded or multipart, as posted by 'index.html') on the event loop.
+    mimetype, options = http.parse_options_header(headers.get(b'content-type', b'').decode('latin-1'))
+    body = await readBody(receive)
+    _, form, _ = formparser.FormDataParser().parse(io.BytesIO(body), mimetype, len(body), options)
+
+    if 'comment' not in form:
+
+        await sendResponse(send, 400, b'The form has no comment.', 'text/plain; charset=utf-8')
+
+        return
+
+    toxicityResult = await scorer.scoreComment(form['comment'])
+
+    # Render the same template as the '/predict' route of the Flask app.
+    with flaskApp.app.test_request_context('/predict', method='POST'):
+
+        page = flask.render_template('index.html', toxicity=toxicityResult)
+
+    await sendResponse(send, 200, page.encode('utf-8'), 'text/html; charset=utf-8')
+
+async def scoreRoute(scope, receive, send, headers):
+
+    query = urllib.parse.parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    stream = (query.get('stream', [''])[0] in ('1', 'true') or
+              b'application/x-ndjson' in headers.get(b'accept', b''))
+
+    try:
+
+        ids, texts = flaskApp.parseScoreRequest(json.loads(await readBody(receive)))
+
+    except ValueError as error:
+
+        await sendJSON(send, 400, {'error': str(error)})
+
+        return
+
+    maxBatchSize = flaskApp.apiMaxStreamSize if stream == True else flaskApp.apiMaxBatchSize
+
+    if len(texts) > maxBatchSize:
+
+        await sendJSON(send, 413, {'error': 'The request holds {} comments, the maximum is {}.'.format(len(texts),
+                                                                                                       maxBatchSize)})
+
+        return
+
+    if stream == False:
+
+        # Predict the toxicity of all the comments in a single pass.
+        results = await scorer.score(await scorer.preprocess(texts))
+        await sendJSON(send, 200, {'results': [{'id': commentId, **result}
+                                               for commentId, result in zip(ids, results)]})
+
+        return
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/x-ndjson')]})
+
+    # Pre-process the next chunk while the current one is scored.
+    chunkSize = flaskApp.apiStreamChunkSize
+    starts = range(0, len(texts), chunkSize)
+    nextChunk = asyncio.ensure_future(scorer.preprocess(texts[:chunkSize]))
+
+    for position, start in enumerate(starts):
+
+        preprocessedTexts = await nextChunk
+
+        if position + 1 < len(starts):
+
+            nextChunk = asyncio.ensure_future(scorer.preprocess(texts[start + chunkSize:start + 2 * chunkSize]))
+
+        results = await scorer.score(preprocessedTexts)
+        lines = ''.join(json.dumps({'id': commentId, **result}) + '\n'
+                        for commentId, result in zip(ids[start:start + chunkSize], results))
+
+        await send({'type': 'http.response.body', 'body': lines.encode('utf-8'), 'more_body': True})
+
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def lifespan(receive, send):
+
+    while True:
+
+        message = await receive()
+
+        if message['type'] == 'lifespan.startup':
+
+            # Start the pre-processing processes before the first request.
+            with startup.phase('startPreprocessPool'):
+
+                await scorer.preprocess(startup.warmUpComments * preprocessWorkers)
+
+            await send({'type': 'lifespan.startup.complete'})
+
+        elif message['type'] == 'lifespan.shutdown':
+
+            scorer.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+
+            return
+
+async def application(scope, receive, send):
+    '''
+    ASGI application of the web app, run with 'uvicorn asgi:application' from this directory. The scoring routes are
+    served on the event loop, the other routes by the Flask app.
+    '''
+
+    if scope['type'] == 'lifespan':
+
+        await lifespan(receive, send)
+
+        return
+
+    if scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'] == '/stats':
+
+        # The statistics of the Flask app, with the batching of the scorer (the 'MicroBatcher' does not run here).
+        await sendJSON(send, 200, flaskApp.statsReport(scorer.stats()))
+
+        return
+
+    if scope['type'] == 'http' and scope['method'] == 'POST':
+
+        headers = dict(scope['headers'])
+
+        if scope['path'] == '/predict':
+
+            await predictRoute(scope, receive, send, headers)
+
+            return
+
+        if scope['path'] == '/api/v1/score':
+
+            await scoreRoute(scope, receive, send, headers)
+
+            return
+
+    await wsgiApplication(scope, receive, send)
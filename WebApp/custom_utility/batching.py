@@ -0,0 +1,179 @@
+import os
+import time
+import queue
+import threading
+import collections
+
+class _PendingRequest:
+    '''
+    Request waiting in the queue of the 'MicroBatcher' for its result.
+    '''
+
+    def __init__(self, item):
+
+        self.item = item
+        self.enqueuedAt = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    '''
+    Scheduler coalescing the concurrent requests into batches, so that each batch is scored in a single call. A batch is
+    closed once it holds 'maxBatchSize' requests or its first request has waited 'maxWaitSeconds', then it is scored by
+    the score function in a background thread and the results are handed back to the waiting requests.
+
+    Parameters:
+    ----------
+    scoreFunction: function
+        Function taking the list of the items of a batch and returning the list of their results, in the same order.
+    maxBatchSize: int
+        Maximum number of requests in a batch.
+    maxWaitSeconds: float
+        Maximum time a request waits for the other requests to join its batch.
+    '''
+
+    def __init__(self, scoreFunction, maxBatchSize=32, maxWaitSeconds=0.005):
+
+        self.scoreFunction = scoreFunction
+        self.maxBatchSize = maxBatchSize
+        self.maxWaitSeconds = maxWaitSeconds
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workerPid = None
+
+        # Statistics of the batches: number of batches of each size, and the time the requests waited in the queue.
+        self._batchSizes = collections.Counter()
+        self._requests = 0
+        self._totalWaitSeconds = 0.0
+        self._maxWaitSeconds = 0.0
+        self._totalScoreSeconds = 0.0
+
+    def _startWorker(self):
+        '''
+        Function to start the background thread scoring the batches, once per process since the threads do not survive
+        forking the process (like the pre-forked gunicorn workers).
+        '''
+
+        with self._lock:
+
+            if self._workerPid != os.getpid():
+
+                threading.Thread(target=self._run, name='MicroBatcher', daemon=True).start()
+                self._workerPid = os.getpid()
+
+    def _nextBatch(self):
+        '''
+        Function to wait for the first request and collect the requests joining it until the batch is closed.
+        '''
+
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueuedAt + self.maxWaitSeconds
+
+        while len(batch) < self.maxBatchSize:
+
+            remaining = deadline - time.perf_counter()
+
+            try:
+
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+
+            except queue.Empty:
+
+                break
+
+        return batch
+
+    def _run(self):
+        '''
+        Function to score the batches one after the other, run in the background thread.
+        '''
+
+        while True:
+
+            batch = self._nextBatch()
+            start = time.perf_counter()
+
+            try:
+
+                results = self.scoreFunction([request.item for request in batch])
+
+                for request, result in zip(batch, results):
+
+                    request.result = result
+
+            except Exception as error:
+
+                for request in batch:
+
+                    request.error = error
+
+            end = time.perf_counter()
+
+            with self._lock:
+
+                self._batchSizes[len(batch)] += 1
+                self._requests += len(batch)
+                self._totalScoreSeconds += end - start
+
+                for request in batch:
+
+                    waitSeconds = start - request.enqueuedAt
+                    self._totalWaitSeconds += waitSeconds
+                    self._maxWaitSeconds = max(self._maxWaitSeconds, waitSeconds)
+
+            for request in batch:
+
+                request.done.set()
+
+    def submit(self, item, timeout=None):
+        '''
+        Function to enqueue an item, wait for the batch holding it to be scored and return its result.
+
+        Parameters:
+        ----------
+        item: object
+            Item to be scored, like a comment text.
+        timeout: float
+            Maximum time (seconds) to wait for the result. None to wait indefinitely.
+        '''
+
+        if self._workerPid != os.getpid():
+
+            self._startWorker()
+
+        request = _PendingRequest(item)
+        self._queue.put(request)
+
+        if not request.done.wait(timeout):
+
+            raise TimeoutError('The request was not scored within {} seconds.'.format(timeout))
+
+        if request.error is not None:
+
+            raise request.error
+
+        return request.result
+
+    def stats(self):
+        '''
+        Function to return the queue depth, the distribution of the batch sizes and the wait and scoring times.
+        '''
+
+        with self._lock:
+
+            batches = sum(self._batchSizes.values())
+
+            return {
+                'queueDepth': self._queue.qsize(),
+                'maxBatchSize': self.maxBatchSize,
+                'maxWaitMilliseconds': 1e3 * self.maxWaitSeconds,
+                'batches': batches,
+                'requests': self._requests,
+                'batchSizes': dict(sorted(self._batchSizes.items())),
+                'meanBatchSize': self._requests / batches if batches else 0.0,
+                'meanWaitMilliseconds': 1e3 * self._totalWaitSeconds / self._requests if self._requests else 0.0,
+                'maxObservedWaitMilliseconds': 1e3 * self._maxWaitSeconds,
+                'meanScoreMilliseconds': 1e3 * self._totalScoreSeconds / batches if batches else 0.0
+            }
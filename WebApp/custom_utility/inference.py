@@ -0,0 +1,314 @@
+import os
+import json
+import threading
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import Model, models
+
+# Element types of the ONNX model inputs, as reported by ONNX Runtime.
+_onnxDtypes = {'tensor(float)': np.float32, 'tensor(double)': np.float64, 'tensor(int32)': np.int32,
+               'tensor(int64)': np.int64}
+
+class Predictor:
+    '''
+    Interface of the inference backends: each backend takes the integer encoded texts padded to the maximum sequence
+    length (int32) and returns the toxicity probabilities as a flat float array, so that any of them can be passed to
+    'predict.function1()' in place of the model.
+    '''
+
+    # Name of the backend and file path of the model it was loaded from (if any).
+    backend = None
+    modelFile = None
+
+    def predictProba(self, paddedText):
+        '''
+        Function to return the toxicity scores of the padded texts as a flat array.
+
+        Parameters:
+        ----------
+        paddedText: numpy.ndarray
+            Integer encoded texts padded to the maximum sequence length.
+        '''
+
+        raise NotImplementedError
+
+    def artifactFiles(self):
+        '''
+        Function to return the file paths of all the files the model was loaded from, empty if it was not loaded from a
+        file.
+        '''
+
+        return [] if self.modelFile is None else [self.modelFile]
+
+
+class InferenceRunner(Predictor):
+    '''
+    Low-latency runner of the toxicity output of a pre-trained model. The small batches (like a single comment from the
+    web app) are scored by a traced function with a fixed input signature, which skips the data adapter and batching
+    machinery of 'model.predict()'. Only the large offline batches go through 'model.predict()'. In both cases only the
+    toxicity output (the first output of the model) is computed, not the auxiliary outputs.
+
+    Parameters:
+    ----------
+    model: tensorflow.keras.Model
+        Pre-trained Model for doing the predictions.
+    maxSeqLen: int
+        Maximum sequence length of the padded texts.
+    directBatchSize: int
+        Largest number of texts scored by the traced function, larger batches go through 'model.predict()'.
+    warmUp: boolean
+        Flag to check whether to trace and run the function once while creating the runner, so that the first real
+        request does not pay for it.
+    '''
+
+    backend = 'keras'
+
+    def __init__(self, model, maxSeqLen=210, directBatchSize=64, warmUp=True):
+
+        self.model = model
+        self.maxSeqLen = maxSeqLen
+        self.directBatchSize = directBatchSize
+
+        # Sub-model computing only the toxicity output, sharing the layers (and weights) of the model.
+        self.toxicityModel = Model(inputs=model.inputs, outputs=model.outputs[0]) if len(model.outputs) > 1 else model
+        inputDtype = model.inputs[0].dtype
+
+        @tf.function(input_signature=[tf.TensorSpec(shape=(None, maxSeqLen), dtype=tf.int32)])
+        def predictFunction(paddedText):
+
+            return self.toxicityModel(tf.cast(paddedText, inputDtype), training=False)
+
+        self._predictFunction = predictFunction
+
+        if warmUp == True:
+
+            self.warmUp()
+
+    def warmUp(self):
+        '''
+        Function to trace the function and run it once on a padded text of zeros.
+        '''
+
+        self._predictFunction(tf.zeros((1, self.maxSeqLen), dtype=tf.int32))
+
+    def predictProba(self, paddedText):
+        '''
+        Function to return the toxicity scores of the padded texts as a flat array.
+
+        Parameters:
+        ----------
+        paddedText: numpy.ndarray
+            Integer encoded texts padded to the maximum sequence length.
+        '''
+
+        if len(paddedText) <= self.directBatchSize:
+
+            return self._predictFunction(tf.convert_to_tensor(paddedText, dtype=tf.int32)).numpy().flatten()
+
+        return np.asarray(self.toxicityModel.predict(paddedText, verbose=0)).flatten()
+
+
+class TFLiteRunner(Predictor):
+    '''
+    Runner of the toxicity output of a model converted to TensorFlow Lite by 'quantize.convertToTFLite()', with the same
+    'predictProba()' as the 'InferenceRunner' so that it can be passed to 'predict.function1()' in place of the model.
+    The fused LSTM kernels of TensorFlow Lite keep their state for the batch size the model was converted with (one),
+    so the texts are run through the interpreter one at a time.
+
+    Parameters:
+    ----------
+    modelFile: str
+        File path of the TensorFlow Lite model, like 'BestModels/modelBiLSTM_dynamic.tflite'.
+    numThreads: int
+        Number of threads used by the interpreter. None to let TensorFlow Lite decide.
+    warmUp: boolean
+        Flag to check whether to run the interpreter once while creating the runner.
+    '''
+
+    backend = 'tflite'
+
+    def __init__(self, modelFile, numThreads=None, warmUp=True):
+
+        self.modelFile = modelFile
+        self.interpreter = tf.lite.Interpreter(model_path=modelFile, num_threads=numThreads)
+        self.interpreter.allocate_tensors()
+
+        inputDetails = self.interpreter.get_input_details()[0]
+        self._inputIndex = inputDetails['index']
+        self._inputDtype = inputDetails['dtype']
+        self._outputIndex = self.interpreter.get_output_details()[0]['index']
+        self.maxSeqLen = int(inputDetails['shape'][1])
+
+        # The interpreter cannot be invoked from two threads at a time.
+        self._lock = threading.Lock()
+
+        if warmUp == True:
+
+            self.predictProba(np.zeros((1, self.maxSeqLen), dtype=np.int32))
+
+    def predictProba(self, paddedText):
+        '''
+        Function to return the toxicity scores of the padded texts as a flat array.
+
+        Parameters:
+        ----------
+        paddedText: numpy.ndarray
+            Integer encoded texts padded to the maximum sequence length.
+        '''
+
+        paddedText = np.asarray(paddedText, dtype=self._inputDtype)
+        yPredProb = np.zeros(len(paddedText), dtype=np.float32)
+
+        with self._lock:
+
+            for position in range(len(paddedText)):
+
+                # The states of the LSTM kernels are variables kept across the invocations, so they are reset first.
+                self.interpreter.reset_all_variables()
+                self.interpreter.set_tensor(self._inputIndex, paddedText[position:position + 1])
+                self.interpreter.invoke()
+                yPredProb[position] = self.interpreter.get_tensor(self._outputIndex)[0, 0]
+
+        return yPredProb
+
+
+class ONNXRunner(Predictor):
+    '''
+    Runner of the toxicity output of a model exported to ONNX by 'export_model.exportONNX()', on the CPU execution
+    provider of ONNX Runtime with all its graph optimizations enabled.
+
+    Parameters:
+    ----------
+    modelFile: str
+        File path of the ONNX model, like 'BestModels/modelBiLSTM.onnx'.
+    numThreads: int
+        Number of threads used within each operator. None to let ONNX Runtime decide.
+    warmUp: boolean
+        Flag to check whether to run the model once while creating the runner.
+    '''
+
+    backend = 'onnx'
+
+    def __init__(self, modelFile, numThreads=None, warmUp=True):
+
+        # ONNX Runtime is only needed by this backend.
+        try:
+
+            import onnxruntime
+
+        except ImportError:
+
+            raise ImportError('The ONNX backend needs the onnxruntime package: pip install onnxruntime')
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        if numThreads is not None:
+
+            options.intra_op_num_threads = numThreads
+
+        self.modelFile = modelFile
+        self.session = onnxruntime.InferenceSession(modelFile, sess_options=options, providers=['CPUExecutionProvider'])
+
+        modelInput = self.session.get_inputs()[0]
+        self._inputName = modelInput.name
+        self._inputDtype = _onnxDtypes[modelInput.type]
+        self.maxSeqLen = int(modelInput.shape[1])
+
+        if warmUp == True:
+
+            self.predictProba(np.zeros((1, self.maxSeqLen), dtype=np.int32))
+
+    def predictProba(self, paddedText):
+        '''
+        Function to return the toxicity scores of the padded texts as a flat array.
+
+        Parameters:
+        ----------
+        paddedText: numpy.ndarray
+            Integer encoded texts padded to the maximum sequence length.
+        '''
+
+        paddedText = np.asarray(paddedText, dtype=self._inputDtype)
+
+        return self.session.run(None, {self._inputName: paddedText})[0].flatten()
+
+
+class SharedEmbeddingRunner(Predictor):
+    '''
+    Runner of a model exported by 'export_model.exportSharedWeights()', whose embedding matrix (by far its largest
+    tensor) is memory-mapped read-only from its '.npy' file instead of being loaded into the model. The pages of the
+    matrix are then shared by all the worker processes mapping the same file, instead of each holding its own copy. The
+    embedding lookup is done on the mapped matrix (copying only the rows of the words of the texts) and the embedded
+    texts are scored by the layers after the embedding layer.
+
+    Parameters:
+    ----------
+    modelFile: str
+        File path of the manifest written by 'export_model.exportSharedWeights()', like
+        'BestModels/modelBiLSTM_shared.json'.
+    batchSize: int
+        Number of texts embedded and scored at a time, bounding the memory taken by the embedded texts.
+    warmUp: boolean
+        Flag to check whether to trace and run the function once while creating the runner.
+    '''
+
+    backend = 'shared'
+
+    def __init__(self, modelFile, batchSize=32, warmUp=True):
+
+        with open(modelFile, 'r') as f:
+
+            manifest = json.load(f)
+
+        directory = os.path.dirname(modelFile)
+        self.modelFile = modelFile
+        self.maxSeqLen = manifest['maxSeqLen']
+        self.batchSize = batchSize
+        self.embeddingFile = os.path.join(directory, manifest['embeddingFile'])
+        self.headModelFile = os.path.join(directory, manifest['headModelFile'])
+        self.embeddingMatrix = np.load(self.embeddingFile, mmap_mode='r')
+        self.headModel = models.load_model(self.headModelFile, compile=False)
+
+        # The matrix can be stored as float16 (by 'compact_embedding.compactEmbedding()'), while the head takes the
+        # embedded texts in the data type of the embedding layer of the model.
+        headDtype = self.headModel.inputs[0].dtype
+
+        @tf.function(input_signature=[tf.TensorSpec(shape=(None, self.maxSeqLen, self.embeddingMatrix.shape[1]),
+                                                    dtype=self.embeddingMatrix.dtype)])
+        def predictFunction(embeddedText):
+
+            return self.headModel(tf.cast(embeddedText, headDtype), training=False)
+
+        self._predictFunction = predictFunction
+
+        if warmUp == True:
+
+            self.predictProba(np.zeros((1, self.maxSeqLen), dtype=np.int32))
+
+    def artifactFiles(self):
+        '''
+        Function to return the file paths of the manifest and of the embedding matrix and model it points to.
+        '''
+
+        return [self.modelFile, self.embeddingFile, self.headModelFile]
+
+    def predictProba(self, paddedText):
+        '''
+        Function to return the toxicity scores of the padded texts as a flat array.
+
+        Parameters:
+        ----------
+        paddedText: numpy.ndarray
+            Integer encoded texts padded to the maximum sequence length.
+        '''
+
+        paddedText = np.asarray(paddedText)
+        yPredProb = np.zeros(len(paddedText), dtype=np.float32)
+
+        for start in range(0, len(paddedText), self.batchSize):
+
+            embeddedText = np.take(self.embeddingMatrix, paddedText[start:start + self.batchSize], axis=0)
+            yPredProb[start:start + self.batchSize] = self._predictFunction(embeddedText).numpy().flatten()
+
+        return yPredProb
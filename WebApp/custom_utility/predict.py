@@ -1,9 +1,214 @@
+import numpy as np
 import pandas as pd
-from custom_utility import preprocess_text
+from custom_utility import inference
+from custom_utility import preprocess_batch
+from custom_utility import registry
 from custom_utility import tokenize
-from tensorflow.keras import preprocessing
+from tensorflow.keras import layers, models
 
-def predictToxicity(tokenizerFile, seqLength, model, testFile='', text=None):
+# Length-agnostic copies of the models used for the bucketed prediction, keyed by the id of the original model (which
+# is kept along to keep its id from being reused).
+_variableLengthModels = dict()
+
+def loadPredictor(backend='keras', modelFile='BestModels/modelBiLSTM.h5', maxSeqLen=210, numThreads=None):
+    '''
+    Function to load the backend used for predicting the toxicity scores. All the backends take the padded int32 ids
+    and return the toxicity probabilities, so the backend can be chosen per deployment (like through an environment
+    variable) without changing the code calling 'function1()'.
+
+    Parameters:
+    ----------
+    backend: str
+        'keras' for a pre-trained (or inference-only) Keras model, 'tflite' for a model converted by 'quantize.py',
+        'onnx' for a model exported by 'export_model.exportONNX()' or 'shared' for the manifest of a model exported by
+        'export_model.exportSharedWeights()', whose embedding matrix is shared by the worker processes.
+    modelFile: str
+        File path of the model for the backend.
+    maxSeqLen: int
+        Maximum sequence length of the padded texts (the TensorFlow Lite and ONNX models carry their own).
+    numThreads: int
+        Number of threads used by the TensorFlow Lite interpreter or ONNX Runtime. None to let them decide.
+    '''
+
+    if backend == 'keras':
+
+        # The loss (and so 'customLoss') is only needed for training.
+        predictor = inference.InferenceRunner(models.load_model(modelFile, compile=False), maxSeqLen=maxSeqLen)
+        predictor.modelFile = modelFile
+
+    elif backend == 'tflite':
+
+        predictor = inference.TFLiteRunner(modelFile, numThreads=numThreads)
+
+    elif backend == 'onnx':
+
+        predictor = inference.ONNXRunner(modelFile, numThreads=numThreads)
+
+    elif backend == 'shared':
+
+        predictor = inference.SharedEmbeddingRunner(modelFile)
+
+    else:
+
+        raise ValueError('Unknown backend {}, it must be one of keras, tflite, onnx or shared.'.format(backend))
+
+    return predictor
+
+
+def _variableLengthModel(model):
+    '''
+    Function to get a copy of the model (with the same weights) that accepts the padded texts of any length, instead of
+    only the sequence length it was built with.
+
+    Parameters:
+    ----------
+    model: tensorflow.keras.Model
+        Model built with a fixed sequence length.
+    '''
+
+    if model.inputs[0].shape[1] is None:
+
+        return model
+
+    if id(model) not in _variableLengthModels:
+
+        variableLengthModel = models.clone_model(model, input_tensors=layers.Input(shape=(None, ),
+                                                                                   dtype=model.inputs[0].dtype))
+        variableLengthModel.set_weights(model.get_weights())
+        _variableLengthModels[id(model)] = (model, variableLengthModel)
+
+    return _variableLengthModels[id(model)][1]
+
+
+def _toxicityScores(yPred):
+    '''
+    Function to get the toxicity scores as a flat array from the output of 'model.predict()', which is the list of all
+    the outputs for the models with the auxiliary outputs and only the toxicity output for the inference-only models.
+
+    Parameters:
+    ----------
+    yPred: list or numpy.ndarray
+        Output of 'model.predict()'.
+    '''
+
+    return (yPred[0] if isinstance(yPred, list) else yPred).flatten()
+
+
+def _predictProba(model, paddedText):
+    '''
+    Function to predict the toxicity scores of the padded texts as a flat array, with either a Keras model or one of the
+    backends of the 'inference' module (see 'loadPredictor()').
+
+    Parameters:
+    ----------
+    model: tensorflow.keras.Model or Predictor
+        Model to used for prediction of the toxicity score.
+    paddedText: numpy.ndarray
+        Integer encoded texts padded to the maximum sequence length.
+    '''
+
+    if isinstance(model, inference.Predictor):
+
+        return model.predictProba(paddedText)
+
+    return _toxicityScores(model.predict(paddedText))
+
+
+def predictBucketed(model, intEncodedTexts, buckets=(32, 64, 128, 210), padding='post', batchSize=512):
+    '''
+    Function to predict the toxicity scores of the integer encoded texts, padding each text only to the smallest length
+    bucket that holds it instead of the maximum sequence length, so that the LSTM layers do not run over the padding.
+    The scores are returned in the order of the texts.
+
+    Parameters:
+    ----------
+    model: tensorflow.keras.Model or InferenceRunner
+        Model to used for prediction of the toxicity score.
+    intEncodedTexts: list
+        Integer encoded texts, as returned by 'texts_to_sequences()' of the tokenizer.
+    buckets: tuple
+        Increasing padding lengths. The last one is the maximum sequence length, longer texts are truncated to it.
+    padding: str
+        Kind of padding to do. Pre-padding or post padding.
+    batchSize: int
+        Number of texts predicted at a time.
+    '''
+
+    # The padded lengths vary from bucket to bucket, so the runner's fixed-signature function cannot be used.
+    if isinstance(model, inference.InferenceRunner):
+
+        model = model.model
+
+    if isinstance(model, inference.Predictor):
+
+        raise ValueError('The {} backend runs a fixed sequence length, it cannot be bucketed.'.format(model.backend))
+
+    variableLengthModel = _variableLengthModel(model)
+    intEncodedTexts = list(intEncodedTexts)
+
+    # Index of the smallest bucket holding each text.
+    lengths = np.array([len(intEncodedText) for intEncodedText in intEncodedTexts], dtype=np.int64)
+    textBuckets = np.searchsorted(buckets, np.minimum(lengths, buckets[-1]))
+
+    yPredProb = np.zeros(len(intEncodedTexts), dtype=np.float32)
+
+    for bucket, bucketLength in enumerate(buckets):
+
+        positions = np.flatnonzero(textBuckets == bucket)
+
+        if len(positions) == 0:
+
+            continue
+
+        paddedText = tokenize.padSequences([intEncodedTexts[position] for position in positions], len(positions),
+                                           bucketLength, padding=padding)
+        yPredProb[positions] = _toxicityScores(variableLengthModel.predict(paddedText, batch_size=batchSize,
+                                                                             verbose=0))
+
+    return yPredProb
+
+
+def verifyBucketedParity(model, intEncodedTexts, buckets=(32, 64, 128, 210), padding='post', tolerance=1e-3):
+    '''
+    Function to compare the bucketed prediction against the prediction with all the texts padded to the maximum sequence
+    length, and return the DataFrame of the texts whose scores differ by more than the tolerance (empty if all agree).
+    The padding is part of the input of the LSTM and pooling layers, so the scores of the texts padded to a shorter
+    bucket can change.
+
+    Parameters:
+    ----------
+    model: tensorflow.keras.Model or InferenceRunner
+        Model to used for prediction of the toxicity score.
+    intEncodedTexts: list
+        Integer encoded texts of the parity corpus, like a sample of the pre-processed comment texts.
+    buckets: tuple
+        Increasing padding lengths. The last one is the maximum sequence length.
+    padding: str
+        Kind of padding to do. Pre-padding or post padding.
+    tolerance: float
+        Largest absolute difference of the scores treated as a match.
+    '''
+
+    if isinstance(model, inference.InferenceRunner):
+
+        model = model.model
+
+    intEncodedTexts = list(intEncodedTexts)
+    paddedText = tokenize.padSequences(intEncodedTexts, len(intEncodedTexts), buckets[-1], padding=padding)
+
+    comparison = pd.DataFrame({
+        'length': [len(intEncodedText) for intEncodedText in intEncodedTexts],
+        'fixedScore': _toxicityScores(model.predict(paddedText, verbose=0)),
+        'bucketedScore': predictBucketed(model, intEncodedTexts, buckets=buckets, padding=padding)
+    })
+    comparison['bucket'] = np.array(buckets)[np.searchsorted(buckets, np.minimum(comparison['length'], buckets[-1]))]
+    comparison['difference'] = (comparison['bucketedScore'] - comparison['fixedScore']).abs()
+    comparison['toxicChanged'] = (comparison['bucketedScore'] >= 0.5) != (comparison['fixedScore'] >= 0.5)
+
+    return comparison[comparison['difference'] > tolerance]
+
+
+def predictToxicity(tokenizerFile, seqLength, model, testFile='', text=None, workers=None, buckets=None):
     '''
     Function to predict the toxicity scores of the given text or the comment texts in the given Test Dataset.
 
@@ -13,12 +218,17 @@ def predictToxicity(tokenizerFile, seqLength, model, testFile='', text=None):
         File path of the tokenizer object.
     seqLength: int
         Maximum sequence length of the comment texts.
-    model: tensorflow.keras.Model
+    model: tensorflow.keras.Model or InferenceRunner
         Model to used for prediction of the toxicity score.
     testFile: str
         File path of the Test Dataset.
     text: str
         Comment Text for which the toxicity score has to be calculated.
+    workers: int
+        Number of worker processes for pre-processing the comment texts. None to use the number of CPUs.
+    buckets: tuple
+        Increasing padding lengths (ending with seqLength) to pad each comment text to the smallest one holding it, like
+        (32, 64, 128, 210). None to pad all the comment texts to seqLength.
     '''
 
     if (text == None and testFile != ''):
@@ -30,28 +240,118 @@ def predictToxicity(tokenizerFile, seqLength, model, testFile='', text=None):
 
         test = pd.DataFrame({'id': [1], 'comment_text': [text]})
 
-    # Preprocess the comment text and store the processed text in a new feature 'preprocessed_text'
-    lstComments = test['comment_text'] # List of all comment texts
-    lstProcessedComments = list() # List to store the preprocess comment texts
+    # Preprocess the comment texts in parallel and store the processed text in a new feature 'preprocessed_text'
+    test['preprocessed_text'] = preprocess_batch.preprocessBatch(test['comment_text'], workers=workers)
 
-    # Preprocess each comment and store in the list 'lstProcessedComments'
-    for comment in lstComments:
+    if buckets is not None:
 
-        lstProcessedComments.append(preprocess_text.preprocess(comment))
-        
-    # Create a new Feature 'preprocessed_text' for the new preprocessed comments.
-    test['preprocessed_text'] = lstProcessedComments
+        # Do integer encoding of the preprocess comments texts and predict them padded to their length buckets.
+        intEncodedTexts = registry.loadTokenizer(tokenizerFile).texts_to_sequences(test['preprocessed_text'])
+        test['prediction'] = predictBucketed(model, intEncodedTexts, buckets=buckets)
+
+    else:
 
-    # Tokenize the preprocess comments texts (Post Padding)
-    gloveCommentTest = tokenize.gloveEmbedText(texts=test['preprocessed_text'], maxLen = seqLength, tokenizerObjFile=tokenizerFile)
+        # Tokenize the preprocess comments texts (Post Padding)
+        gloveCommentTest = tokenize.gloveEmbedText(texts=test['preprocessed_text'], maxLen = seqLength, tokenizerObjFile=tokenizerFile)
 
-    # Predict the probabilities of the class label of the Test Dataset and store it in a new feature 'yPredProb' of the Test Dataset.
-    test['prediction'] = model.predict(gloveCommentTest)[0].flatten()
+        # Predict the probabilities of the class label of the Test Dataset and store it in a new feature 'yPredProb' of the Test Dataset.
+        test['prediction'] = _predictProba(model, gloveCommentTest)
 
     # Return the dataframe required in the format of submission file
     return test[['id', 'prediction']]
 
-def function1(text, tokenizerObj, model, textFeature='comment_text', maxSeqLen=210, paddingType='post'):
+def predictToxicityCSV(tokenizerFile, seqLength, model, testFile, outputFile, chunkSize=10000, workers=None,
+                       resume=False, buckets=None):
+    '''
+    Function to predict the toxicity scores of the comment texts in the given Test Dataset, streaming it in chunks so
+    that the memory stays flat irrespective of its size. While a chunk is being tokenized and predicted, the next chunk
+    is pre-processed over a process pool, and the 'id' and 'prediction' of each chunk are appended to the output CSV
+    file as soon as it is predicted. An interrupted run can be resumed from its last completed chunk.
+
+    Parameter:
+    ---------
+    tokenizerFile: str
+        File path of the tokenizer object.
+    seqLength: int
+        Maximum sequence length of the comment texts.
+    model: tensorflow.keras.Model or InferenceRunner
+        Model to used for prediction of the toxicity score.
+    testFile: str
+        File path of the Test Dataset.
+    outputFile: str
+        File path of the CSV file to be written in the format of the submission file.
+    chunkSize: int
+        Number of rows read, pre-processed, predicted and written at a time.
+    workers: int
+        Number of worker processes for pre-processing the comment texts. None to use the number of CPUs.
+    resume: boolean
+        Flag to check whether to continue an interrupted run from its last completed chunk or to start afresh.
+    buckets: tuple
+        Increasing padding lengths (ending with seqLength) to pad each comment text to the smallest one holding it, like
+        (32, 64, 128, 210). None to pad all the comment texts to seqLength.
+    '''
+
+    tokenizer = registry.loadTokenizer(tokenizerFile)
+
+    def predictChunk(chunk, preprocessedText):
+
+        if buckets is not None:
+
+            intEncodedTexts = tokenizer.texts_to_sequences(preprocessedText)
+            chunk['prediction'] = predictBucketed(model, intEncodedTexts, buckets=buckets)
+
+        else:
+
+            # The padded buffer is reused by every chunk.
+            paddedText = tokenize.encodeAndPad(preprocessedText, tokenizer, seqLength, reuseBuffer=True)
+            chunk['prediction'] = _predictProba(model, paddedText)
+
+        return chunk[['id', 'prediction']]
+
+    # Read only the features needed for the prediction.
+    return preprocess_batch.processCSV(testFile, outputFile, predictChunk, textFeature='comment_text',
+                                       features=['id', 'comment_text'], chunkSize=chunkSize, workers=workers,
+                                       resume=resume)
+
+def scorePreprocessed(preprocessedText, tokenizerObj, model, maxSeqLen=210, paddingType='post', buckets=None):
+    '''
+    Function to predict the toxicity scores of the pre-processed comment texts, so that the pre-processing can be done
+    elsewhere (like in the process pool of the async server) than the tokenization and prediction.
+
+    Parameters:
+    ----------
+    preprocessedText: list or Series
+        Pre-processed comment text(s).
+    tokenizerObj: Tokenizer
+        Tokenizer object to be used for tokenizing the text(s).
+    model: keras.engine.functional.Functional or Predictor
+        Pre-trained Model for doing the predictions, or the backend returned by 'loadPredictor()'.
+    maxSeqLen: int
+        Maximum sequence length.
+    paddingType: str
+        Type of padding to be done: post or pre.
+    buckets: tuple
+        Increasing padding lengths (ending with maxSeqLen) to pad each text to the smallest one holding it. None to pad
+        all the texts to maxSeqLen.
+    '''
+
+    if buckets is None:
+
+        # Do integer encoding of the input text(s) and pad them (Post Padding) in a single pass, into the padded buffer
+        # reused by every call in the current thread.
+        paddedText = tokenize.encodeAndPad(preprocessedText, tokenizerObj, maxSeqLen, padding=paddingType,
+                                           reuseBuffer=True)
+
+        return _predictProba(model, paddedText)
+
+    # Do integer encoding of the input text(s), the bucketed prediction pads them itself.
+    intEncodedTexts = tokenizerObj.texts_to_sequences(preprocessedText)
+
+    return predictBucketed(model, intEncodedTexts, buckets=buckets, padding=paddingType)
+
+
+def function1(text, tokenizerObj, model, textFeature='comment_text', maxSeqLen=210, paddingType='post', workers=1,
+              buckets=None):
     '''
     Function to implement the data pipeline for transforming the dataset into the required format as required by the Model
     and predict whether the given text is toxic or not, along with the toxicity score.
@@ -62,14 +362,19 @@ def function1(text, tokenizerObj, model, textFeature='comment_text', maxSeqLen=2
         Comment Text(s) to be checked for toxicity
     tokenizerObj: Tokenizer
         Tokenizer object to be used for tokenizing the text(s).
-    model: keras.engine.functional.Functional
-        Pre-trained Model for doing the predictions.
+    model: keras.engine.functional.Functional or Predictor
+        Pre-trained Model for doing the predictions, or the backend returned by 'loadPredictor()'.
     textFeature: str
         Name of the feature containing comment texts in case a DataFrame is passed as input.
     maxSeqLen: int
         Maximum sequence length.
     paddingType: str
         Type of padding to be done: post or pre.
+    workers: int
+        Number of worker processes for pre-processing the comment texts. None to use the number of CPUs.
+    buckets: tuple
+        Increasing padding lengths (ending with maxSeqLen) to pad each text to the smallest one holding it, like
+        (32, 64, 128, 210). None to pad all the texts to maxSeqLen.
     '''
     
     # region - Data Pre-processing -----------------------------------------------------------------------------------
@@ -89,35 +394,23 @@ def function1(text, tokenizerObj, model, textFeature='comment_text', maxSeqLen=2
         
         rawText = text
         
-    # Pre-processing the comment text(s) and store it in a list
-    preprocessedText = rawText.apply(preprocess_text.preprocess)
+    # Pre-processing the comment text(s) and store it in a Series
+    preprocessedText = pd.Series(preprocess_batch.preprocessBatch(rawText, workers=workers), index=rawText.index,
+                                 dtype=object)
     
     # endregion - Data Pre-processing --------------------------------------------------------------------------------
     # ----------------------------------------------------------------------------------------------------------------
     
     
     
-    # region - Tokenization ------------------------------------------------------------------------------------------
+    # region - Tokenization and Prediction ---------------------------------------------------------------------------
     # ----------------------------------------------------------------------------------------------------------------
 
-    # Do integer encoding of the input text(s).
-    intEncodedTexts = tokenizerObj.texts_to_sequences(preprocessedText)
-    
-    # Pad the integer encoded comments texts (Post Padding) and return.
-    paddedText = preprocessing.sequence.pad_sequences(intEncodedTexts, maxlen=maxSeqLen, padding=paddingType)
-
-    # endregion - Tokenization ---------------------------------------------------------------------------------------
-    # ----------------------------------------------------------------------------------------------------------------
-    
-    
-    
-    # region - Prediction --------------------------------------------------------------------------------------------
-    # ----------------------------------------------------------------------------------------------------------------
-    
-    yPredProb = model.predict(paddedText)[0].flatten()
+    yPredProb = scorePreprocessed(preprocessedText, tokenizerObj, model, maxSeqLen=maxSeqLen, paddingType=paddingType,
+                                  buckets=buckets)
     yPredToxic = ['Yes' if prob >= 0.5 else 'No' for prob in yPredProb]
     
-    # endregion - Prediction -----------------------------------------------------------------------------------------
+    # endregion - Tokenization and Prediction ------------------------------------------------------------------------
     # ----------------------------------------------------------------------------------------------------------------
 
 
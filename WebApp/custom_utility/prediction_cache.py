@@ -0,0 +1,280 @@
+import os
+import time
+import hashlib
+import threading
+import collections
+from custom_utility import preprocess_cache
+from custom_utility import registry
+
+class _InFlight:
+    '''
+    Prediction being computed for a key, waited on by the concurrent requests for the same key.
+    '''
+
+    def __init__(self):
+
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.computeSeconds = 0.0
+
+
+def modelVersion(predictor):
+    '''
+    Function to return the version of the model artifact run by a backend: its name and the hash of each file it was
+    loaded from (like the manifest, embedding matrix and model of the 'shared' backend), so that the predictions of
+    another model (even from the same file paths) do not share the cache entries.
+
+    Parameters:
+    ----------
+    predictor: Predictor
+        Backend returned by 'predict.loadPredictor()'.
+    '''
+
+    artifactFiles = predictor.artifactFiles()
+
+    if len(artifactFiles) == 0:
+
+        # Without a file, the model is only known to the current process.
+        return '{}:{}:{}'.format(predictor.backend, os.getpid(), id(predictor))
+
+    return ':'.join([predictor.backend] + [registry.fileDigest(filePath) for filePath in artifactFiles])
+
+
+class PredictionCache:
+    '''
+    Cache of the predictions of the web app, keyed by a hash of the pre-processed text and the version of the model, so
+    that the raw texts which are the same once pre-processed share an entry. The entries are bounded by their number
+    (evicting the least recently used entry) and by their age. Concurrent requests for a key which is being computed
+    wait for that computation instead of repeating it.
+
+    Parameters:
+    ----------
+    version: str
+        Version of the model artifact, like the one returned by 'modelVersion()'.
+    maxSize: int
+        Maximum number of entries.
+    ttlSeconds: float
+        Maximum age (seconds) of an entry. None to keep the entries until they are evicted.
+    '''
+
+    def __init__(self, version, maxSize=100000, ttlSeconds=3600):
+
+        self.version = version
+        self.maxSize = maxSize
+        self.ttlSeconds = ttlSeconds
+        self._entries = collections.OrderedDict()
+        self._inFlight = dict()
+        self._lock = threading.Lock()
+        self.hits = self.coalesced = self.misses = self.evictions = self.expirations = self.errors = 0
+        self.savedSeconds = self.computeSeconds = 0.0
+
+    def key(self, preprocessedText):
+        '''
+        Function to compute the key of a pre-processed text.
+
+        Parameters:
+        ----------
+        preprocessedText: str
+            Pre-processed comment text.
+        '''
+
+        return hashlib.blake2b((self.version + '\0' + preprocessedText).encode('utf-8', 'surrogatepass'),
+                               digest_size=16).digest()
+
+    def lookup(self, key):
+        '''
+        Function to return the cached prediction of a key, or None if it is not cached (or has expired).
+
+        Parameters:
+        ----------
+        key: bytes
+            Key returned by 'key()'.
+        '''
+
+        with self._lock:
+
+            entry = self._entries.get(key)
+
+            if entry is None:
+
+                return None
+
+            result, expiresAt, computeSeconds = entry
+
+            if expiresAt is not None and expiresAt <= time.monotonic():
+
+                del self._entries[key]
+                self.expirations += 1
+
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.savedSeconds += computeSeconds
+
+            return dict(result)
+
+    def store(self, key, result, computeSeconds):
+        '''
+        Function to cache the prediction of a key, evicting the least recently used entry if the cache is full.
+
+        Parameters:
+        ----------
+        key: bytes
+            Key returned by 'key()'.
+        result: dict
+            Prediction of the text.
+        computeSeconds: float
+            Time taken to compute the prediction, counted as saved each time it is reused.
+        '''
+
+        with self._lock:
+
+            self.misses += 1
+            self.computeSeconds += computeSeconds
+            expiresAt = time.monotonic() + self.ttlSeconds if self.ttlSeconds is not None else None
+            self._entries[key] = (result, expiresAt, computeSeconds)
+
+            if len(self._entries) > self.maxSize:
+
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def recordCoalesced(self, computeSeconds):
+        '''
+        Function to count a request which waited for the computation of another request for the same key.
+
+        Parameters:
+        ----------
+        computeSeconds: float
+            Time taken by the computation it waited for.
+        '''
+
+        with self._lock:
+
+            self.coalesced += 1
+            self.savedSeconds += computeSeconds
+
+    def get(self, text, computeFunction):
+        '''
+        Function to return the prediction of the given text, computing it only if it is neither cached nor being
+        computed for another request.
+
+        Parameters:
+        ----------
+        text: str
+            Raw comment text.
+        computeFunction: function
+            Function taking the raw text and returning its prediction, like the 'submit()' of the 'MicroBatcher'.
+        '''
+
+        key = self.key(preprocess_cache.preprocess(text) if isinstance(text, str) else '')
+        result = self.lookup(key)
+
+        if result is not None:
+
+            return result
+
+        with self._lock:
+
+            inFlight = self._inFlight.get(key)
+            isOwner = inFlight is None
+
+            if isOwner == True:
+
+                inFlight = self._inFlight[key] = _InFlight()
+
+        if isOwner == False:
+
+            inFlight.done.wait()
+
+            if inFlight.error is not None:
+
+                raise inFlight.error
+
+            self.recordCoalesced(inFlight.computeSeconds)
+
+            return dict(inFlight.result)
+
+        start = time.perf_counter()
+
+        # Error seen by the waiting requests if the computation is interrupted by an exception which is not an
+        # 'Exception' (like KeyboardInterrupt or SystemExit), only raised by the owner.
+        inFlight.error = RuntimeError('The prediction of the comment was interrupted.')
+
+        try:
+
+            try:
+
+                inFlight.result = computeFunction(text)
+                inFlight.error = None
+
+            except Exception as error:
+
+                inFlight.error = error
+
+            inFlight.computeSeconds = time.perf_counter() - start
+
+            if inFlight.error is None:
+
+                self.store(key, inFlight.result, inFlight.computeSeconds)
+
+        finally:
+
+            # Whatever happens, the key is released and the waiting requests are woken up, so that they do not wait
+            # forever and the next request for the key computes it again.
+            with self._lock:
+
+                del self._inFlight[key]
+
+                if inFlight.error is not None:
+
+                    # The errors are not cached, the next request for the key computes it again.
+                    self.errors += 1
+
+            inFlight.done.set()
+
+        if inFlight.error is not None:
+
+            raise inFlight.error
+
+        return dict(inFlight.result)
+
+    def stats(self):
+        '''
+        Function to return the hit, miss, coalescing and eviction counters of the cache, its hit rate and the compute time
+        it saved.
+        '''
+
+        with self._lock:
+
+            requests = self.hits + self.coalesced + self.misses
+
+            return {
+                'version': self.version,
+                'size': len(self._entries),
+                'maxSize': self.maxSize,
+                'ttlSeconds': self.ttlSeconds,
+                'inFlight': len(self._inFlight),
+                'hits': self.hits,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'errors': self.errors,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hitRate': (self.hits + self.coalesced) / requests if requests else 0.0,
+                'computeSeconds': self.computeSeconds,
+                'savedSeconds': self.savedSeconds
+            }
+
+    def clear(self):
+        '''
+        Function to remove all the entries and reset the counters.
+        '''
+
+        with self._lock:
+
+            self._entries.clear()
+            self.hits = self.coalesced = self.misses = self.evictions = self.expirations = self.errors = 0
+            self.savedSeconds = self.computeSeconds = 0.0
@@ -0,0 +1,138 @@
+import os
+import time
+import pickle
+import hashlib
+import threading
+from custom_utility import vocabulary
+
+# Loaded tokenizers keyed by the absolute file path, along with the file signature they were loaded from and the load
+# statistics.
+_tokenizers = dict()
+_lock = threading.Lock()
+
+def currentRSS():
+    '''
+    Function to return the resident set size (bytes) of the current process, or None if it cannot be read.
+    '''
+
+    try:
+
+        with open('/proc/self/statm', 'r') as f:
+
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    except (OSError, ValueError, IndexError):
+
+        return None
+
+
+def fileDigest(filePath):
+    '''
+    Function to compute the hash of the contents of a file.
+
+    Parameters:
+    ----------
+    filePath: str
+        File path of the file to be hashed.
+    '''
+
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(filePath, 'rb') as f:
+
+        for block in iter(lambda: f.read(1 << 20), b''):
+
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def loadTokenizer(tokenizerObjFile):
+    '''
+    Function to return the tokenizer object stored in the given file, unpickling it only once per process. The file is
+    unpickled again only if its contents change, which is checked through its modification time and size and then
+    confirmed through its hash. A vocabulary file exported from the tokenizer is memory-mapped instead.
+
+    Parameters:
+    ----------
+    tokenizerObjFile: str
+        File path containing the tokenizer object, or the vocabulary exported from it.
+    '''
+
+    filePath = os.path.abspath(tokenizerObjFile)
+    stat = os.stat(filePath)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _lock:
+
+        entry = _tokenizers.get(filePath)
+
+        if entry is not None and entry['signature'] == signature:
+
+            entry['hits'] += 1
+
+            return entry['tokenizer']
+
+        digest = fileDigest(filePath)
+
+        # The file was only touched or copied over with the same contents.
+        if entry is not None and entry['digest'] == digest:
+
+            entry['signature'] = signature
+            entry['hits'] += 1
+
+            return entry['tokenizer']
+
+        rssBefore = currentRSS()
+        start = time.perf_counter()
+
+        # A vocabulary exported by 'vocabulary.exportVocabulary()' is memory-mapped instead of unpickled.
+        if vocabulary.isVocabularyFile(filePath):
+
+            tokenizer = vocabulary.Vocabulary(filePath)
+
+        else:
+
+            with open(filePath, 'rb') as f:
+
+                tokenizer = pickle.load(f)
+
+        loadSeconds = time.perf_counter() - start
+        rssAfter = currentRSS()
+
+        _tokenizers[filePath] = {
+            'tokenizer': tokenizer,
+            'signature': signature,
+            'digest': digest,
+            'fileBytes': stat.st_size,
+            'loadSeconds': loadSeconds,
+            'rssDeltaBytes': rssAfter - rssBefore if rssBefore is not None and rssAfter is not None else None,
+            'vocabularySize': len(tokenizer.word_index) if hasattr(tokenizer, 'word_index') else len(tokenizer),
+            'loads': entry['loads'] + 1 if entry is not None else 1,
+            'hits': 0
+        }
+
+        return tokenizer
+
+
+def stats():
+    '''
+    Function to return the load time, memory footprint and number of loads and hits of each loaded tokenizer.
+    '''
+
+    with _lock:
+
+        return {
+            filePath: {key: value for key, value in entry.items() if key not in ('tokenizer', 'signature')}
+            for filePath, entry in _tokenizers.items()
+        }
+
+
+def clear():
+    '''
+    Function to drop all the loaded tokenizers, so that they are unpickled again on the next use.
+    '''
+
+    with _lock:
+
+        _tokenizers.clear()
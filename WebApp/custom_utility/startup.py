@@ -0,0 +1,177 @@
+import os
+import time
+import threading
+import contextlib
+from custom_utility import registry
+
+# Time taken by each phase of the startup of the current process, in the order they were run.
+_phases = dict()
+_lock = threading.Lock()
+_readySeconds = None
+_readyMemory = None
+
+# Backends whose loaded model can be shared by forking the process. The TensorFlow runtime (and ONNX Runtime) cannot be
+# used in a forked process once initialized: the thread pools of the parent do not exist in the child, and the first
+# prediction deadlocks. The same goes for the TensorFlow Lite interpreter once its thread pool is running (with more
+# than one thread), so every backend is loaded in the workers after forking. Importing TensorFlow is safe.
+forkSafeBackends = ()
+
+# Comments scored at the end of the startup, so that the first real request does not pay for the first call of the
+# pre-processing, the tokenizer and the model.
+warmUpComments = ['Thank you for the article, it was a great read!', 'You are an IDIOT and nobody likes you :(']
+
+def secondsSinceProcessStart():
+    '''
+    Function to return the time elapsed (seconds) since the current process was started (or forked), or None if it
+    cannot be read.
+    '''
+
+    try:
+
+        with open('/proc/self/stat', 'r') as f:
+
+            # The fields after the command name, which is in parentheses and can hold spaces.
+            fields = f.read().rsplit(')', 1)[1].split()
+
+        with open('/proc/uptime', 'r') as f:
+
+            uptime = float(f.read().split()[0])
+
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+
+    except (OSError, ValueError, IndexError):
+
+        return None
+
+
+def memoryReport():
+    '''
+    Function to return the memory (bytes) of the current process: its resident set size, its proportional set size (each
+    page shared with other processes counted for its share) and the sizes of its shared and private pages, or None if it
+    cannot be read.
+    '''
+
+    try:
+
+        with open('/proc/self/smaps_rollup', 'r') as f:
+
+            fields = {line.split(':')[0]: int(line.split()[1]) * 1024 for line in f if line.endswith('kB\n')}
+
+    except (OSError, ValueError, IndexError):
+
+        return None
+
+    return {
+        'rssBytes': fields.get('Rss'),
+        'pssBytes': fields.get('Pss'),
+        'sharedBytes': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+        'privateBytes': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    }
+
+
+@contextlib.contextmanager
+def phase(name):
+    '''
+    Function to time a phase of the startup, like loading the model, along with the change of the resident set size.
+
+    Parameters:
+    ----------
+    name: str
+        Name of the phase, like 'loadModel'.
+    '''
+
+    rss = registry.currentRSS()
+    start = time.perf_counter()
+
+    try:
+
+        yield
+
+    finally:
+
+        elapsed = time.perf_counter() - start
+        rssDelta = registry.currentRSS() - rss if rss is not None else None
+
+        with _lock:
+
+            _phases[name] = {'seconds': elapsed, 'rssDeltaBytes': rssDelta, 'pid': os.getpid()}
+
+
+def isForkSafe(backend):
+    '''
+    Function to check whether the model of a backend can be loaded before forking the worker processes.
+
+    Parameters:
+    ----------
+    backend: str
+        Name of the backend, like 'keras' or 'tflite'.
+    '''
+
+    return backend in forkSafeBackends
+
+
+def warmUp(scoreFunction, comments=None):
+    '''
+    Function to run the score function once on the warm-up comments, timed as the 'warmUp' phase.
+
+    Parameters:
+    ----------
+    scoreFunction: function
+        Function taking the list of the comments and returning the list of their results.
+    comments: list
+        Comments to be scored. None to use the default warm-up comments.
+    '''
+
+    with phase('warmUp'):
+
+        scoreFunction(list(warmUpComments if comments is None else comments))
+
+
+def markReady():
+    '''
+    Function to record the time from the start of the process until it is ready to serve the requests, and its memory
+    at that time.
+    '''
+
+    global _readySeconds, _readyMemory
+
+    _readySeconds = secondsSinceProcessStart()
+    _readyMemory = memoryReport()
+
+
+def readyReport():
+    '''
+    Function to return a line reporting the time until the current process was ready and its memory at that time.
+    '''
+
+    report = 'Worker {} ready'.format(os.getpid())
+
+    if _readySeconds is not None:
+
+        report += ' in {:.1f}s'.format(_readySeconds)
+
+    if _readyMemory is not None:
+
+        report += ': RSS {:.0f} MB, PSS {:.0f} MB, shared {:.0f} MB, private {:.0f} MB'.format(
+            *(_readyMemory[name] / 2 ** 20 for name in ('rssBytes', 'pssBytes', 'sharedBytes', 'privateBytes')))
+
+    return report
+
+
+def stats():
+    '''
+    Function to return the time and memory taken by each phase of the startup and the time until the process was ready.
+    The phases run before forking (in preload mode) report the pid of the parent process.
+    '''
+
+    with _lock:
+
+        return {
+            'pid': os.getpid(),
+            'phases': {name: dict(values) for name, values in _phases.items()},
+            'totalPhaseSeconds': sum(values['seconds'] for values in _phases.values()),
+            'readySeconds': _readySeconds,
+            'readyMemory': _readyMemory,
+            'memory': memoryReport(),
+            'rssBytes': registry.currentRSS()
+        }
@@ -1,5 +1,104 @@
-import pickle
-from tensorflow.keras import preprocessing
+import threading
+import numpy as np
+from custom_utility import registry
+
+# Padded buffer of each thread, reused across the calls of 'encodeAndPad()' with 'reuseBuffer=True'.
+_buffers = threading.local()
+
+def _getBuffer(numTexts, maxLen):
+    '''
+    Function to get a zeroed int32 array of the given shape backed by the padded buffer of the current thread, growing
+    the buffer if it is too small.
+
+    Parameters:
+    ----------
+    numTexts: int
+        Number of rows (texts).
+    maxLen: int
+        Number of columns (maximum sequence length).
+    '''
+
+    buffer = getattr(_buffers, 'buffer', None)
+
+    if buffer is None or buffer.size < numTexts * maxLen:
+
+        buffer = _buffers.buffer = np.zeros(max(numTexts * maxLen, 1), dtype=np.int32)
+
+    paddedTexts = buffer[:numTexts * maxLen].reshape(numTexts, maxLen)
+    paddedTexts.fill(0)
+
+    return paddedTexts
+
+
+def padSequences(intEncodedTexts, numTexts, maxLen, padding='post', truncating='pre', reuseBuffer=False):
+    '''
+    Function to write the integer encoded texts straight into an int32 array of the padded shape, with the same padding
+    and truncation as 'preprocessing.sequence.pad_sequences()'.
+
+    Parameters:
+    -----------
+    intEncodedTexts: iterable
+        Integer encoded texts, like a list or the generator returned by 'texts_to_sequences_generator()'.
+    numTexts: int
+        Number of the integer encoded texts.
+    maxLen: int
+        Maximum sequence length to be used as the padding length.
+    padding: str
+        Kind of padding to do. Pre-padding or post padding.
+    truncating: str
+        Kind of truncation of the texts longer than maxLen. Remove the values from the beginning (pre) or the end (post).
+    reuseBuffer: boolean
+        Flag to check whether to write into the padded buffer of the current thread instead of a new array. The returned
+        array is then overwritten by the next call, so it must not be kept beyond it.
+    '''
+
+    if padding not in ('pre', 'post') or truncating not in ('pre', 'post'):
+
+        raise ValueError('Padding and truncating must be either "pre" or "post".')
+
+    paddedTexts = _getBuffer(numTexts, maxLen) if reuseBuffer == True else np.zeros((numTexts, maxLen), dtype=np.int32)
+
+    for paddedText, intEncodedText in zip(paddedTexts, intEncodedTexts):
+
+        if len(intEncodedText) > maxLen:
+
+            intEncodedText = intEncodedText[-maxLen:] if truncating == 'pre' else intEncodedText[:maxLen]
+
+        if padding == 'post':
+
+            paddedText[:len(intEncodedText)] = intEncodedText
+
+        elif len(intEncodedText) > 0:
+
+            paddedText[-len(intEncodedText):] = intEncodedText
+
+    return paddedTexts
+
+
+def encodeAndPad(texts, tokenizer, maxLen, padding='post', truncating='pre', reuseBuffer=False):
+    '''
+    Function to do the integer encoding of the texts and pad them in a single pass, writing the ids of each text
+    straight into the padded int32 array instead of building the list of all the encoded texts first.
+
+    Parameters:
+    -----------
+    texts: Series or list
+        Series or list containing the comment text(s).
+    tokenizer: Tokenizer
+        Tokenizer object (or the vocabulary exported from it) to be used for tokenizing the text(s).
+    maxLen: int
+        Maximum sequence length to be used as the padding length.
+    padding: str
+        Kind of padding to do. Pre-padding or post padding.
+    truncating: str
+        Kind of truncation of the texts longer than maxLen. Remove the values from the beginning (pre) or the end (post).
+    reuseBuffer: boolean
+        Flag to check whether to write into the padded buffer of the current thread instead of a new array.
+    '''
+
+    return padSequences(tokenizer.texts_to_sequences_generator(texts), len(texts), maxLen, padding=padding,
+                        truncating=truncating, reuseBuffer=reuseBuffer)
+
 
 def gloveEmbedText(texts, maxLen, tokenizerObjFile, padding='post'):
     '''
@@ -17,13 +116,8 @@ def gloveEmbedText(texts, maxLen, tokenizerObjFile, padding='post'):
         Kind of padding to do. Pre-padding or post padding.
     '''
 
-    # Load the tokenizer object
-    with open(tokenizerObjFile, 'rb') as f:
-        
-        tokenizer = pickle.load(f)
+    # Get the tokenizer object, unpickled only once per process.
+    tokenizer = registry.loadTokenizer(tokenizerObjFile)
 
-    # Do integer encoding of the input text(s).
-    intEncodedTexts = tokenizer.texts_to_sequences(texts)
-    
-    # Pad the integer encoded comments texts (Post Padding) and return.
-    return preprocessing.sequence.pad_sequences(intEncodedTexts, maxlen=maxLen, padding=padding)
\ No newline at end of file
+    # Do integer encoding of the input text(s) and pad them (Post Padding) in a single pass and return.
+    return encodeAndPad(texts, tokenizer, maxLen, padding=padding)
\ No newline at end of file
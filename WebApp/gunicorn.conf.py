@@ -0,0 +1,46 @@
+import os
+import gc
+
+# Settings of gunicorn, read with 'gunicorn app:app' from this directory. The number of workers and the preload mode
+# can be set through the environment variables.
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8080')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Load the app once in the master process before forking the workers, so that TensorFlow and the tokenizer are loaded
+# once and their pages are shared copy-on-write by the workers. The model is loaded by each worker after forking.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Loading the model takes a while, the workers are not killed while loading it.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+if preload_app == True:
+
+    # Let 'app.py' know that it is loaded before forking.
+    os.environ['PRELOAD_APP'] = '1'
+
+def when_ready(server):
+
+    if preload_app == True:
+
+        # Move the objects of the loaded app out of the garbage collector, which would otherwise write to their pages
+        # (and so copy them) in each worker.
+        gc.freeze()
+
+def post_fork(server, worker):
+
+    if preload_app == True:
+
+        import app
+        from custom_utility import startup
+
+        if app.runner is None:
+
+            # Load the model (of the backends which cannot be shared by forking), which reports the memory of the worker.
+            app.loadPretrainedObj()
+
+        else:
+
+            # The model was loaded before forking, only the memory of the worker is reported.
+            startup.markReady()
+            print(startup.readyReport(), flush=True)
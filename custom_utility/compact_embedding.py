@@ -0,0 +1,442 @@
+import os
+import copy
+import pickle
+import argparse
+import collections
+import numpy as np
+import pandas as pd
+from tensorflow.keras import layers, models
+from custom_utility import inference
+from custom_utility import performance_metrics
+from custom_utility import quantize
+from custom_utility import registry
+from custom_utility import tokenize
+
+# Word returned for the id 1 (0 is the padding) when decoding the ids of the compact tokenizer. All the pruned words are
+# encoded as the id 1, whose embedding is the zero vector (like the words without a pre-trained vector in the original
+# embedding matrix).
+prunedToken = '<pruned>'
+
+def _embeddingLayer(model):
+    '''
+    Function to return the embedding layer of a model.
+    '''
+
+    return next(layer for layer in model.layers if isinstance(layer, layers.Embedding))
+
+
+def pruneVocabulary(tokenizer, embeddingMatrix, minCount=2, maxWords=None):
+    '''
+    Function to select the words kept in the pruned vocabulary: the words seen at least 'minCount' times in the training
+    texts (as counted in 'word_counts' of the tokenizer) which have a non-zero row in the embedding matrix, up to the
+    'maxWords' most frequent. The OOV token of the tokenizer (if any) is always kept. Returns the kept words (by
+    increasing id, so by decreasing frequency), the pruned words and the number of words pruned for each reason.
+
+    Parameters:
+    ----------
+    tokenizer: tensorflow.keras.preprocessing.text.Tokenizer
+        Tokenizer fitted on the training texts.
+    embeddingMatrix: numpy.ndarray
+        Embedding matrix of the model, whose row i is the vector of the word with id i.
+    minCount: int
+        Minimum number of occurrences of a word in the training texts to be kept.
+    maxWords: int
+        Maximum number of words kept. None to keep all the words passing the other criteria.
+    '''
+
+    isZeroVector = ~np.asarray(embeddingMatrix).any(axis=1)
+    keptWords = []
+    prunedWords = []
+    pruned = {'zeroVectorWords': 0, 'lowCountWords': 0, 'maxWordsCutoff': 0}
+
+    for word, index in sorted(tokenizer.word_index.items(), key=lambda item: item[1]):
+
+        # The words beyond 'num_words' (or the rows of the matrix) are never encoded with their own id, so they are left
+        # out of the compact tokenizer and encoded as before (dropped, or as the OOV token).
+        if index >= len(embeddingMatrix) or (tokenizer.num_words is not None and index >= tokenizer.num_words):
+
+            continue
+
+        if word == tokenizer.oov_token:
+
+            keptWords.append(word)
+
+            continue
+
+        if tokenizer.word_counts.get(word, 0) < minCount:
+
+            pruned['lowCountWords'] += 1
+
+        elif isZeroVector[index] == True:
+
+            pruned['zeroVectorWords'] += 1
+
+        elif maxWords is not None and len(keptWords) >= maxWords:
+
+            pruned['maxWordsCutoff'] += 1
+
+        else:
+
+            keptWords.append(word)
+
+            continue
+
+        prunedWords.append(word)
+
+    return keptWords, prunedWords, pruned
+
+
+def buildPrunedTokenizer(tokenizer, keptWords, prunedWords):
+    '''
+    Function to build a copy of the tokenizer encoding the kept words with the ids 2, 3, ... in the order of the kept
+    words, and all the pruned words with the id 1 (the zero vector). The words the tokenizer has never seen are encoded
+    as before: dropped, or encoded as its OOV token if it has one. So each word keeps its position in the encoded texts.
+    The counts of the words are carried over, so that the compact tokenizer can be pruned again.
+
+    Parameters:
+    ----------
+    tokenizer: tensorflow.keras.preprocessing.text.Tokenizer
+        Tokenizer fitted on the training texts.
+    keptWords: list
+        Words kept in the pruned vocabulary, as returned by 'pruneVocabulary()'.
+    prunedWords: list
+        Words pruned from the vocabulary, as returned by 'pruneVocabulary()'.
+    '''
+
+    prunedTokenizer = copy.copy(tokenizer)
+    prunedTokenizer.num_words = None
+
+    prunedTokenizer.word_index = {word: 1 for word in prunedWords}
+    prunedTokenizer.word_index.update({word: position + 2 for position, word in enumerate(keptWords)})
+    prunedTokenizer.index_word = {1: prunedToken}
+    prunedTokenizer.index_word.update({position + 2: word for position, word in enumerate(keptWords)})
+
+    words = [word for word in keptWords + prunedWords if word in tokenizer.word_counts]
+    prunedTokenizer.word_counts = collections.OrderedDict((word, tokenizer.word_counts[word]) for word in words)
+    prunedTokenizer.word_docs = collections.defaultdict(int, {word: tokenizer.word_docs[word] for word in words
+                                                              if word in tokenizer.word_docs})
+    prunedTokenizer.index_docs = collections.defaultdict(int)
+
+    for word, count in prunedTokenizer.word_docs.items():
+
+        prunedTokenizer.index_docs[prunedTokenizer.word_index[word]] += count
+
+    return prunedTokenizer
+
+
+def buildCompactModel(model, keptIndices, dtype='float16'):
+    '''
+    Function to build a copy of a model whose embedding layer only holds the rows of the kept words, stored as 'dtype'.
+    Row 0 is the padding row of the original matrix, row 1 the zero vector of the pruned words and row i + 2 the row
+    'keptIndices[i]' of the original matrix. The layers after the embedding layer compute in float32 as before, the
+    embedded texts being cast to float32 on their way in.
+
+    Parameters:
+    ----------
+    model: tensorflow.keras.Model
+        Pre-trained model.
+    keptIndices: list
+        Ids of the kept words in the original tokenizer, in the order of their new ids.
+    dtype: str
+        Data type of the embedding matrix of the compact model, like 'float16' or 'float32'.
+    '''
+
+    embeddingLayer = _embeddingLayer(model)
+    embeddingMatrix = embeddingLayer.get_weights()[0]
+    compactMatrix = np.concatenate([embeddingMatrix[:1], np.zeros((1, embeddingMatrix.shape[1])),
+                                    embeddingMatrix[np.asarray(keptIndices, dtype=np.int64)]]).astype(dtype)
+
+    def cloneLayer(layer):
+
+        config = layer.get_config()
+
+        if layer is embeddingLayer:
+
+            config.update({'input_dim': len(compactMatrix), 'dtype': dtype})
+
+        return layer.__class__.from_config(config)
+
+    compactModel = models.clone_model(model, clone_function=cloneLayer)
+
+    # The layers are cloned in the same order, only the weights of the embedding layer change.
+    for layer, compactLayer in zip(model.layers, compactModel.layers):
+
+        compactLayer.set_weights([compactMatrix] if layer is embeddingLayer else layer.get_weights())
+
+    return compactModel
+
+
+def _sampleTexts(tokenizer, sampleSize, seqLen, unseenRate=0.05):
+    '''
+    Function to generate random texts of the words of a tokenizer, drawn by their number of occurrences in the training
+    texts (so that they look like the real texts), along with some words it has never seen. Their lengths go beyond the
+    maximum sequence length, so that the truncation is also compared.
+    '''
+
+    random = np.random.RandomState(0)
+    words = list(tokenizer.word_counts.keys())
+    counts = np.asarray(list(tokenizer.word_counts.values()), dtype=np.float64)
+    unseenWord = 'unseen' + ''.join(words[:1])
+
+    while unseenWord in tokenizer.word_index:
+
+        unseenWord += 'x'
+
+    words.append(unseenWord)
+    probabilities = np.append((1 - unseenRate) * counts / counts.sum(), unseenRate)
+
+    return [' '.join(random.choice(words, size=random.randint(1, seqLen + 50), p=probabilities))
+            for _ in range(sampleSize)]
+
+
+def compactEmbedding(modelFile, tokenizerFile, outputModelFile, outputTokenizerFile, minCount=2, maxWords=None,
+                     dtype='float16', texts=None, sampleSize=512, tolerance=1e-3):
+    '''
+    Function to compact the embedding matrix of a model in 'BestModels/' and its tokenizer: the vocabulary is pruned by
+    'pruneVocabulary()' (the pruned words are encoded as the id 1, the zero vector), and the rows of the kept words are
+    stored as 'dtype'. The compact model and tokenizer are written to new files, loaded like the original ones (the
+    tokenizer by 'registry.loadTokenizer()' or exported by 'vocabulary.exportVocabulary()'). Returns the sizes of the
+    vocabularies and embedding matrices, along with the differences of the scores of the compact model and tokenizer:
+    - 'maxDifference' and 'meanDifference' against the original model whose rows of the pruned words are zeroed, so
+    the differences only come from the steps which should not change the scores (the remapping of the words, the
+    pruning of the words without vector and the cast to 'dtype'). They are checked against the tolerance.
+    - 'prunedMaxDifference' and 'prunedMeanDifference' against the original model, so the differences also come from
+    pruning the words by their count ('minCount' and 'maxWords'). They are only reported, the effect of the pruning on
+    the AUC and final metric being measured by 'compactionReport()'.
+
+    Parameters:
+    ----------
+    modelFile: str
+        File path of the pre-trained model, like 'BestModels/modelBiLSTM.h5'.
+    tokenizerFile: str
+        File path of the pickled tokenizer the model was trained with, like 'Resources/tokenizer.pkl'.
+    outputModelFile: str
+        File path of the compact model to be written, like 'BestModels/modelBiLSTM_compact.h5'.
+    outputTokenizerFile: str
+        File path of the compact tokenizer to be written, like 'Resources/tokenizer_compact.pkl'.
+    minCount: int
+        Minimum number of occurrences of a word in the training texts to be kept.
+    maxWords: int
+        Maximum number of words kept. None to keep all the words passing the other criteria.
+    dtype: str
+        Data type of the compact embedding matrix, like 'float16' or 'float32'.
+    texts: list
+        Pre-processed comment texts to compare the scores on, like a sample of the validation set. None to use random
+        texts of the words of the tokenizer.
+    sampleSize: int
+        Number of random texts to compare the scores on, if no texts are given.
+    tolerance: float
+        Largest absolute difference of the scores (against the original model without the pruned words) treated as a
+        match.
+    '''
+
+    with open(tokenizerFile, 'rb') as f:
+
+        tokenizer = pickle.load(f)
+
+    if not hasattr(tokenizer, 'word_counts'):
+
+        raise ValueError('{} holds no word counts, the pickled Keras Tokenizer is needed.'.format(tokenizerFile))
+
+    # The loss (and so 'customLoss') is only needed for training.
+    model = models.load_model(modelFile, compile=False)
+    embeddingMatrix = _embeddingLayer(model).get_weights()[0]
+
+    keptWords, prunedWords, pruned = pruneVocabulary(tokenizer, embeddingMatrix, minCount=minCount, maxWords=maxWords)
+    prunedTokenizer = buildPrunedTokenizer(tokenizer, keptWords, prunedWords)
+    compactModel = buildCompactModel(model, [tokenizer.word_index[word] for word in keptWords], dtype=dtype)
+    compactModel.save(outputModelFile)
+
+    with open(outputTokenizerFile, 'wb') as f:
+
+        pickle.dump(prunedTokenizer, f)
+
+    seqLen = model.inputs[0].shape[1]
+
+    if texts is None:
+
+        texts = _sampleTexts(tokenizer, sampleSize, seqLen)
+
+    # Each model is scored on the texts encoded by its own tokenizer, so that the remapping of the words is checked too.
+    texts = list(texts)
+    paddedText = tokenize.encodeAndPad(texts, tokenizer, seqLen)
+    compactScores = inference.InferenceRunner(models.load_model(outputModelFile, compile=False),
+                                              maxSeqLen=seqLen).predictProba(tokenize.encodeAndPad(texts, prunedTokenizer,
+                                                                                                   seqLen))
+    originalScores = inference.InferenceRunner(model, maxSeqLen=seqLen).predictProba(paddedText)
+    referenceScores = originalScores
+
+    # The pruned words with a vector change the scores on purpose, so the compact model is checked against a copy of
+    # the original model whose rows of these words are zeroed (like the row of the pruned words in the compact model).
+    prunedIndices = [tokenizer.word_index[word] for word in prunedWords]
+    prunedIndices = [index for index in prunedIndices if embeddingMatrix[index].any()]
+
+    if len(prunedIndices) > 0:
+
+        referenceMatrix = embeddingMatrix.copy()
+        referenceMatrix[prunedIndices] = 0
+        referenceModel = models.clone_model(model)
+        referenceModel.set_weights(model.get_weights())
+        _embeddingLayer(referenceModel).set_weights([referenceMatrix])
+        referenceScores = inference.InferenceRunner(referenceModel, maxSeqLen=seqLen).predictProba(paddedText)
+
+    difference = np.abs(compactScores - referenceScores)
+    prunedDifference = np.abs(compactScores - originalScores)
+
+    report = {
+        'modelFile': modelFile,
+        'outputModelFile': outputModelFile,
+        'outputTokenizerFile': outputTokenizerFile,
+        'originalWords': len(tokenizer.word_index),
+        'keptWords': len(keptWords),
+        'prunedWords': len(prunedWords),
+        'originalEmbeddingBytes': embeddingMatrix.nbytes,
+        'compactEmbeddingBytes': _embeddingLayer(compactModel).get_weights()[0].nbytes,
+        'maxDifference': float(difference.max()),
+        'meanDifference': float(difference.mean()),
+        'prunedMaxDifference': float(prunedDifference.max()),
+        'prunedMeanDifference': float(prunedDifference.mean())
+    }
+    report.update(pruned)
+
+    if report['maxDifference'] > tolerance:
+
+        for outputFile in (outputModelFile, outputTokenizerFile):
+
+            os.remove(outputFile)
+
+        raise ValueError('The scores of the compact model differ by up to {} from {} without the pruned words, use '
+                         'float32.'.format(report['maxDifference'], modelFile))
+
+    return report
+
+
+def compactionReport(modelFile, tokenizerFile, compactModelFile, compactTokenizerFile, evaluationFile, seqLen=210,
+                     sampleSize=20000, textFeature='preprocessed_text', actualClassLabel='target',
+                     subgroups=quantize.identitySubgroups):
+    '''
+    Function to compare a model and its compact model on a labelled sample (like a sample of the validation set), and
+    return a DataFrame with the overall AUC, the final metric of the competition, the size of the embedding matrix and
+    the file sizes of each, along with the differences of their scores and metrics.
+
+    Parameters:
+    ----------
+    modelFile: str
+        File path of the pre-trained model.
+    tokenizerFile: str
+        File path of the tokenizer of the pre-trained model.
+    compactModelFile: str
+        File path of the compact model written by 'compactEmbedding()'.
+    compactTokenizerFile: str
+        File path of the compact tokenizer written by 'compactEmbedding()'.
+    evaluationFile: str
+        File path of the CSV file containing the pre-processed comment texts, the class label and identity subgroups.
+    seqLen: int
+        Maximum sequence length of the comment texts.
+    sampleSize: int
+        Number of rows of the CSV file to evaluate on. None to evaluate on all the rows.
+    textFeature: str
+        Name of the feature containing the pre-processed comment texts.
+    actualClassLabel: str
+        Name of the class label (toxicity score).
+    subgroups: list
+        Names of the identity subgroups.
+    '''
+
+    data = quantize.readSample(evaluationFile, sampleSize, [textFeature, actualClassLabel] + list(subgroups))
+
+    # Binary class label and identity subgroups, in the same way as the modelling notebooks.
+    data[actualClassLabel] = data[actualClassLabel] >= 0.5
+
+    for subgroup in subgroups:
+
+        data[subgroup] = data[subgroup].fillna(0) >= 0.5
+
+    files = {'original': (modelFile, tokenizerFile), 'compact': (compactModelFile, compactTokenizerFile)}
+    report = dict()
+
+    for name, (nameModelFile, nameTokenizerFile) in files.items():
+
+        model = models.load_model(nameModelFile, compile=False)
+        paddedText = tokenize.encodeAndPad(data[textFeature].fillna(''), registry.loadTokenizer(nameTokenizerFile),
+                                           seqLen)
+        data[name] = inference.InferenceRunner(model, maxSeqLen=seqLen).predictProba(paddedText)
+
+        biasMetrics = performance_metrics.computeBiasMetricsForModel(data=data, subgroups=subgroups,
+                                                                     predClassLabel=name,
+                                                                     actualClassLabel=actualClassLabel)
+        overallAUC = performance_metrics.computeOverallAUC(data=data, actualClassLabel=actualClassLabel,
+                                                           predClassLabel=name)
+        embeddingLayer = _embeddingLayer(model)
+
+        report[name] = {
+            'modelFile': nameModelFile,
+            'vocabularySize': embeddingLayer.input_dim,
+            'embeddingDtype': embeddingLayer.dtype,
+            'embeddingBytes': embeddingLayer.get_weights()[0].nbytes,
+            'modelFileBytes': os.path.getsize(nameModelFile),
+            'tokenizerFileBytes': os.path.getsize(nameTokenizerFile),
+            'overallAUC': overallAUC,
+            'finalMetric': performance_metrics.computeFinalMetric(biasMetrics, overallAUC)
+        }
+
+    difference = (data['compact'] - data['original']).abs()
+    report['compact']['embeddingBytesSaved'] = (report['original']['embeddingBytes'] -
+                                                report['compact']['embeddingBytes'])
+    report['compact']['overallAUCDelta'] = report['compact']['overallAUC'] - report['original']['overallAUC']
+    report['compact']['finalMetricDelta'] = report['compact']['finalMetric'] - report['original']['finalMetric']
+    report['compact']['maxScoreDifference'] = difference.max()
+    report['compact']['meanScoreDifference'] = difference.mean()
+    report['compact']['toxicChanged'] = int(((data['compact'] >= 0.5) != (data['original'] >= 0.5)).sum())
+
+    return pd.DataFrame(report).T
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Prune the vocabulary of a pre-trained model and store its embedding '
+                                                 'matrix in float16.')
+    parser.add_argument('modelFile', help='Pre-trained model, like BestModels/modelBiLSTM.h5')
+    parser.add_argument('--tokenizer', dest='tokenizerFile', default='Resources/tokenizer.pkl')
+    parser.add_argument('--min-count', dest='minCount', type=int, default=2,
+                        help='Minimum number of occurrences of a word in the training texts to be kept.')
+    parser.add_argument('--max-words', dest='maxWords', type=int, default=None,
+                        help='Maximum number of (most frequent) words kept.')
+    parser.add_argument('--dtype', choices=('float16', 'float32'), default='float16')
+    parser.add_argument('--data', dest='dataFile', default='Data/preprocessed_validation.csv',
+                        help='Pre-processed and labelled comment texts for the report.')
+    parser.add_argument('--seq-len', dest='seqLen', type=int, default=210)
+    parser.add_argument('--check-size', dest='checkSize', type=int, default=512,
+                        help='Number of texts the scores of the compact model are checked on.')
+    parser.add_argument('--tolerance', type=float, default=1e-3,
+                        help='Largest difference of the scores of the compact model allowed by the check, against the '
+                             'original model without the pruned words.')
+    parser.add_argument('--report-size', dest='reportSize', type=int, default=20000)
+    parser.add_argument('--no-report', dest='report', action='store_false')
+    args = parser.parse_args()
+
+    outputModelFile = os.path.splitext(args.modelFile)[0] + '_compact.h5'
+    outputTokenizerFile = os.path.splitext(args.tokenizerFile)[0] + '_compact.pkl'
+
+    checkTexts = None
+
+    if os.path.isfile(args.dataFile):
+
+        # Check on a different sample than the one of the report.
+        checkTexts = quantize.readSample(args.dataFile, args.checkSize, ['preprocessed_text'],
+                                         randomState=0)['preprocessed_text'].fillna('')
+
+    report = compactEmbedding(args.modelFile, args.tokenizerFile, outputModelFile, outputTokenizerFile,
+                              minCount=args.minCount, maxWords=args.maxWords, dtype=args.dtype, texts=checkTexts,
+                              sampleSize=args.checkSize, tolerance=args.tolerance)
+
+    print('Compacted {} into {} and {}: {} -> {} words ({} without vector, {} below the minimum count), {} -> {} bytes '
+          'of embedding matrix, max score difference {:.2e} without the pruned words and {:.2e} with them'.format(
+              args.modelFile, outputModelFile, outputTokenizerFile, report['originalWords'], report['keptWords'],
+              report['zeroVectorWords'], report['lowCountWords'], report['originalEmbeddingBytes'],
+              report['compactEmbeddingBytes'], report['maxDifference'], report['prunedMaxDifference']))
+
+    if args.report == True:
+
+        print(compactionReport(args.modelFile, args.tokenizerFile, outputModelFile, outputTokenizerFile, args.dataFile,
+                               seqLen=args.seqLen, sampleSize=args.reportSize).to_string())
@@ -0,0 +1,319 @@
+import os
+import json
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import Model, layers, models
+from custom_utility import inference
+
+# Layers that only act while training and are the identity at inference time.
+_trainingOnlyLayers = (layers.Dropout, layers.GaussianDropout, layers.GaussianNoise, layers.AlphaDropout)
+
+def _withoutDropout(config):
+    '''
+    Function to set the dropout rates of a layer configuration (like the input and recurrent dropout of the LSTM layers,
+    including the ones wrapped by the Bidirectional layers) to zero.
+
+    Parameters:
+    ----------
+    config: dict
+        Configuration of the layer, as returned by 'get_config()'.
+    '''
+
+    if isinstance(config, dict):
+
+        return {key: 0.0 if key in ('dropout', 'recurrent_dropout') else _withoutDropout(value)
+                for key, value in config.items()}
+
+    if isinstance(config, list):
+
+        return [_withoutDropout(value) for value in config]
+
+    return config
+
+
+def _cloneForInference(layer):
+    '''
+    Function to clone a layer for the inference graph, replacing the training-only layers with the identity.
+
+    Parameters:
+    ----------
+    layer: tensorflow.keras.layers.Layer
+        Layer of the original model.
+    '''
+
+    if isinstance(layer, _trainingOnlyLayers):
+
+        return layers.Activation('linear', name=layer.name)
+
+    return layer.__class__.from_config(_withoutDropout(layer.get_config()))
+
+
+def buildInferenceModel(model):
+    '''
+    Function to build the inference-only graph of a model: only its toxicity output (the first output), without the
+    auxiliary output heads and the dropout layers, and with the same weights.
+
+    Parameters:
+    ----------
+    model: tensorflow.keras.Model
+        Model with the toxicity output and the auxiliary outputs.
+    '''
+
+    clonedModel = models.clone_model(model, clone_function=_cloneForInference)
+
+    # The identity layers replacing the dropout layers have no weights, so the weights are in the same order.
+    clonedModel.set_weights(model.get_weights())
+
+    return Model(inputs=clonedModel.inputs, outputs=clonedModel.outputs[0], name=model.name + '_inference')
+
+
+def _toxicityScores(model, paddedText):
+    '''
+    Function to predict the toxicity scores of the padded texts as a flat array.
+    '''
+
+    yPred = model.predict(paddedText, batch_size=256, verbose=0)
+
+    return (yPred[0] if isinstance(yPred, list) else yPred).flatten()
+
+
+def _randomPaddedText(model, sampleSize):
+    '''
+    Function to generate random padded texts for a model: random ids over the vocabulary of its embedding layer, with
+    post padding of random lengths.
+    '''
+
+    seqLen = model.inputs[0].shape[1]
+    vocabSize = next(layer.input_dim for layer in model.layers if isinstance(layer, layers.Embedding))
+    random = np.random.RandomState(0)
+    paddedText = random.randint(1, vocabSize, size=(sampleSize, seqLen)).astype(np.int32)
+    paddedText[np.arange(seqLen) >= random.randint(1, seqLen + 1, size=(sampleSize, 1))] = 0
+
+    return paddedText
+
+
+def exportInferenceModel(modelFile, outputFile, paddedText=None, sampleSize=512, tolerance=1e-5):
+    '''
+    Function to export a model in 'BestModels/' into an inference-only model file, holding only the toxicity output and
+    no dropout layers, loss or optimizer. It is loaded with 'models.load_model(outputFile)', without 'customLoss' in
+    'custom_objects'. The scores of the exported model are checked against the original model before returning.
+
+    Parameters:
+    ----------
+    modelFile: str
+        File path of the pre-trained model, like 'BestModels/modelBiLSTM.h5'.
+    outputFile: str
+        File path of the inference-only model to be written, like 'BestModels/modelBiLSTM_inference.h5'.
+    paddedText: numpy.ndarray
+        Padded texts to compare the scores on, like a sample of the tokenized comment texts. None to use random texts.
+    sampleSize: int
+        Number of random texts to compare the scores on, if no padded texts are given.
+    tolerance: float
+        Largest absolute difference of the scores treated as a match.
+    '''
+
+    # The loss (and so 'customLoss') is only needed for training.
+    model = models.load_model(modelFile, compile=False)
+    inferenceModel = buildInferenceModel(model)
+    inferenceModel.save(outputFile)
+
+    if paddedText is None:
+
+        paddedText = _randomPaddedText(model, sampleSize)
+
+    difference = np.abs(_toxicityScores(models.load_model(outputFile), paddedText) - _toxicityScores(model, paddedText))
+
+    report = {
+        'modelFile': modelFile,
+        'outputFile': outputFile,
+        'originalParameters': model.count_params(),
+        'inferenceParameters': inferenceModel.count_params(),
+        'originalBytes': os.path.getsize(modelFile),
+        'inferenceBytes': os.path.getsize(outputFile),
+        'maxDifference': float(difference.max()),
+        'meanDifference': float(difference.mean())
+    }
+
+    if report['maxDifference'] > tolerance:
+
+        os.remove(outputFile)
+
+        raise ValueError('The scores of the exported model differ by up to {} from {}.'.format(
+            report['maxDifference'], modelFile))
+
+    return report
+
+
+def exportONNX(modelFile, outputFile, opset=13, paddedText=None, sampleSize=512, tolerance=1e-4):
+    '''
+    Function to export the inference-only graph of a model in 'BestModels/' into an ONNX model, run by the 'onnx' backend
+    of 'predict.loadPredictor()'. The scores of the ONNX model are checked against the original model before returning.
+
+    Parameters:
+    ----------
+    modelFile: str
+        File path of the pre-trained model, like 'BestModels/modelBiLSTM.h5'.
+    outputFile: str
+        File path of the ONNX model to be written, like 'BestModels/modelBiLSTM.onnx'.
+    opset: int
+        ONNX operator set version of the exported model.
+    paddedText: numpy.ndarray
+        Padded texts to compare the scores on, like a sample of the tokenized comment texts. None to use random texts.
+    sampleSize: int
+        Number of random texts to compare the scores on, if no padded texts are given.
+    tolerance: float
+        Largest absolute difference of the scores treated as a match.
+    '''
+
+    # The converter is only needed to export the ONNX models.
+    try:
+
+        import tf2onnx
+
+    except ImportError:
+
+        raise ImportError('Exporting to ONNX needs the tf2onnx package: pip install tf2onnx onnxruntime')
+
+    model = models.load_model(modelFile, compile=False)
+    inferenceModel = buildInferenceModel(model)
+
+    # Dynamic batch size, and the fixed sequence length of the padded texts of 'function1()'.
+    inputSignature = (tf.TensorSpec((None, model.inputs[0].shape[1]), model.inputs[0].dtype, name='paddedText'),)
+    tf2onnx.convert.from_keras(inferenceModel, input_signature=inputSignature, opset=opset, output_path=outputFile)
+
+    if paddedText is None:
+
+        paddedText = _randomPaddedText(model, sampleSize)
+
+    difference = np.abs(inference.ONNXRunner(outputFile).predictProba(paddedText) - _toxicityScores(model, paddedText))
+
+    report = {
+        'modelFile': modelFile,
+        'outputFile': outputFile,
+        'originalBytes': os.path.getsize(modelFile),
+        'onnxBytes': os.path.getsize(outputFile),
+        'maxDifference': float(difference.max()),
+        'meanDifference': float(difference.mean())
+    }
+
+    if report['maxDifference'] > tolerance:
+
+        os.remove(outputFile)
+
+        raise ValueError('The scores of the ONNX model differ by up to {} from {}.'.format(
+            report['maxDifference'], modelFile))
+
+    return report
+
+
+def exportSharedWeights(modelFile, manifestFile, paddedText=None, sampleSize=512, tolerance=1e-5):
+    '''
+    Function to export a model in 'BestModels/' for the 'shared' backend of 'predict.loadPredictor()': the matrix of its
+    embedding layer is written into a '.npy' file memory-mapped read-only by the worker processes, which share a single
+    copy of its pages, and the layers after the embedding layer are written into an inference-only model taking the
+    embedded texts. The manifest file ties both together. The scores are checked against the original model before
+    returning.
+
+    Parameters:
+    ----------
+    modelFile: str
+        File path of the pre-trained model, like 'BestModels/modelBiLSTM.h5'.
+    manifestFile: str
+        File path of the manifest to be written, like 'BestModels/modelBiLSTM_shared.json'. The embedding matrix and the
+        model are written next to it, with the same name and the suffixes '_embedding.npy' and '_head.h5'.
+    paddedText: numpy.ndarray
+        Padded texts to compare the scores on, like a sample of the tokenized comment texts. None to use random texts.
+    sampleSize: int
+        Number of random texts to compare the scores on, if no padded texts are given.
+    tolerance: float
+        Largest absolute difference of the scores treated as a match.
+    '''
+
+    model = models.load_model(modelFile, compile=False)
+    inferenceModel = buildInferenceModel(model)
+    embeddingLayer = next(layer for layer in inferenceModel.layers if isinstance(layer, layers.Embedding))
+
+    root = os.path.splitext(manifestFile)[0]
+    manifest = {
+        'embeddingFile': os.path.basename(root + '_embedding.npy'),
+        'headModelFile': os.path.basename(root + '_head.h5'),
+        'maxSeqLen': int(inferenceModel.inputs[0].shape[1])
+    }
+
+    # The '.npy' format keeps the matrix contiguous after a small aligned header, so it is mapped without copying. The
+    # data type of the matrix is kept, so that a float16 matrix (of a compact model) takes half the shared pages.
+    np.save(root + '_embedding.npy', np.ascontiguousarray(embeddingLayer.get_weights()[0]))
+    Model(inputs=embeddingLayer.output, outputs=inferenceModel.outputs[0]).save(root + '_head.h5')
+
+    with open(manifestFile, 'w') as f:
+
+        json.dump(manifest, f, indent=2)
+
+    if paddedText is None:
+
+        paddedText = _randomPaddedText(model, sampleSize)
+
+    difference = np.abs(inference.SharedEmbeddingRunner(manifestFile).predictProba(paddedText) -
+                        _toxicityScores(model, paddedText))
+
+    report = {
+        'modelFile': modelFile,
+        'outputFile': manifestFile,
+        'originalBytes': os.path.getsize(modelFile),
+        'embeddingBytes': os.path.getsize(root + '_embedding.npy'),
+        'headBytes': os.path.getsize(root + '_head.h5'),
+        'maxDifference': float(difference.max()),
+        'meanDifference': float(difference.mean())
+    }
+
+    if report['maxDifference'] > tolerance:
+
+        for outputFile in (manifestFile, root + '_embedding.npy', root + '_head.h5'):
+
+            os.remove(outputFile)
+
+        raise ValueError('The scores of the shared model differ by up to {} from {}.'.format(
+            report['maxDifference'], modelFile))
+
+    return report
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Export the pre-trained models into inference-only models.')
+    parser.add_argument('modelFiles', nargs='+', help='Pre-trained models, like BestModels/modelBiLSTM.h5')
+    parser.add_argument('--suffix', default='_inference', help='Suffix added to the name of each exported model.')
+    parser.add_argument('--onnx', action='store_true', help='Export into ONNX models (.onnx) instead.')
+    parser.add_argument('--opset', type=int, default=13, help='ONNX operator set version.')
+    parser.add_argument('--shared', action='store_true',
+                        help='Export for the shared backend instead (memory-mapped embedding matrix and model head).')
+    args = parser.parse_args()
+
+    for modelFile in args.modelFiles:
+
+        root, extension = os.path.splitext(modelFile)
+
+        if args.onnx == True:
+
+            report = exportONNX(modelFile, root + '.onnx', opset=args.opset)
+
+            print('Exported {} into {}: {} -> {} bytes, max score difference {:.2e}'.format(
+                modelFile, report['outputFile'], report['originalBytes'], report['onnxBytes'], report['maxDifference']))
+
+            continue
+
+        if args.shared == True:
+
+            report = exportSharedWeights(modelFile, root + '_shared.json')
+
+            print('Exported {} into {}: {} bytes of embedding matrix shared by the workers, max score difference '
+                  '{:.2e}'.format(modelFile, report['outputFile'], report['embeddingBytes'], report['maxDifference']))
+
+            continue
+
+        report = exportInferenceModel(modelFile, root + args.suffix + extension)
+
+        print('Exported {} into {}: {} -> {} parameters, max score difference {:.2e}'.format(
+            modelFile, report['outputFile'], report['originalParameters'], report['inferenceParameters'],
+            report['maxDifference']))
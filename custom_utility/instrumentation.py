@@ -0,0 +1,68 @@
+import time
+import threading
+
+# Statistics of each timed stage: number of calls, cumulative time (seconds) and the total length of the input and
+# output texts.
+_stageStats = dict()
+_lock = threading.Lock()
+
+def timeStage(stage, function):
+    '''
+    Function to wrap a pre-processing stage, so that each call records its time and the length of its input and output
+    text into the statistics of the stage.
+
+    Parameters:
+    ----------
+    stage: str
+        Name of the stage, like 'html' or 'decontraction'.
+    function: function
+        Function implementing the stage. It takes the text as its first argument and returns the processed text.
+    '''
+
+    def timedFunction(text, *args, **kwargs):
+
+        start = time.perf_counter()
+        processedText = function(text, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        with _lock:
+
+            stats = _stageStats.setdefault(stage, [0, 0.0, 0, 0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += len(text)
+            stats[3] += len(processedText)
+
+        return processedText
+
+    return timedFunction
+
+
+def getStats():
+    '''
+    Function to return the statistics of each timed stage recorded in the current process.
+    '''
+
+    with _lock:
+
+        return {
+            stage: {
+                'calls': calls,
+                'totalSeconds': seconds,
+                'meanMicroseconds': 1e6 * seconds / calls if calls else 0.0,
+                'inputChars': inputChars,
+                'outputChars': outputChars,
+                'charDelta': outputChars - inputChars
+            }
+            for stage, (calls, seconds, inputChars, outputChars) in _stageStats.items()
+        }
+
+
+def resetStats():
+    '''
+    Function to clear the statistics of all the stages.
+    '''
+
+    with _lock:
+
+        _stageStats.clear()
@@ -0,0 +1,307 @@
+import os
+import json
+import argparse
+import collections
+import pandas as pd
+from concurrent import futures
+from custom_utility import preprocess_cache
+
+def _preprocessTexts(texts, preprocessArgs):
+    '''
+    Function to pre-process a list of texts through the pre-processing cache, run in the worker processes of the process
+    pool.
+
+    Parameters:
+    ----------
+    texts: list
+        List of the texts to be pre-processed.
+    preprocessArgs: dict
+        Keyword arguments (flags) to be passed to the 'preprocess()' function.
+    '''
+
+    preprocessedTexts = [preprocess_cache.preprocess(text, **preprocessArgs) for text in texts]
+
+    # The worker processes of the pool exit without running the exit handlers, so the new entries are written to the
+    # on-disk tier after each list.
+    preprocess_cache.flush()
+
+    return preprocessedTexts
+
+
+def _splitIntoChunks(texts, chunkSize):
+    '''
+    Function to split a list of texts into the chunks of the given size.
+
+    Parameters:
+    ----------
+    texts: list
+        List of the texts to be split.
+    chunkSize: int
+        Number of texts in each chunk.
+    '''
+
+    return [texts[start:start + chunkSize] for start in range(0, len(texts), chunkSize)]
+
+
+def preprocessBatch(texts, workers=None, chunkSize=1000, **preprocessArgs):
+    '''
+    Function to pre-process a batch of texts in parallel over a process pool and return the pre-processed texts in the
+    same order as the input.
+
+    Parameters:
+    ----------
+    texts: list or Series
+        Texts on which the pre-processing has to be performed.
+    workers: int
+        Number of worker processes. None to use the number of CPUs, 1 to pre-process in the current process.
+    chunkSize: int
+        Number of texts sent to a worker process at a time.
+    preprocessArgs:
+        Flags to be passed to the 'preprocess()' function, like html, accent, isBERTUsed etc.
+    '''
+
+    texts = list(texts)
+    workers = workers or os.cpu_count() or 1
+
+    # The process pool only pays off if there is more than one chunk to be shared among the workers.
+    if workers == 1 or len(texts) <= chunkSize:
+
+        return _preprocessTexts(texts, preprocessArgs)
+
+    chunks = _splitIntoChunks(texts, chunkSize)
+
+    with futures.ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+
+        # 'map()' yields the results in the order of the chunks, irrespective of the order in which they finish.
+        results = executor.map(_preprocessTexts, chunks, [preprocessArgs] * len(chunks))
+
+        return [preprocessedText for chunk in results for preprocessedText in chunk]
+
+
+def _inputIdentity(inputFile):
+    '''
+    Function to return the identity of an input file (its path, size and modification time), recorded in the progress
+    file so that a run is only resumed on the same input.
+
+    Parameters:
+    ----------
+    inputFile: str
+        File path of the input file.
+    '''
+
+    fileStat = os.stat(inputFile)
+
+    return {'path': os.path.abspath(inputFile), 'size': fileStat.st_size, 'mtimeNs': fileStat.st_mtime_ns}
+
+
+def _readProgress(progressFile, chunkSize, inputFile):
+    '''
+    Function to read the progress of an earlier run of 'processCSV()' from its progress file.
+
+    Parameters:
+    ----------
+    progressFile: str
+        File path of the progress file.
+    chunkSize: int
+        Number of rows in each chunk of the current run.
+    inputFile: str
+        File path of the input file of the current run.
+    '''
+
+    if not os.path.isfile(progressFile):
+
+        return None
+
+    with open(progressFile, 'r') as f:
+
+        progress = json.load(f)
+
+    # The completed chunks can be skipped only if the input is split into the same chunks as in the earlier run.
+    if progress['chunkSize'] != chunkSize:
+
+        raise ValueError('The earlier run used a chunk size of {}, resume it with the same chunk size.'.format(
+            progress['chunkSize']))
+
+    # The rows of the earlier run are kept only if they come from the same (unchanged) input file.
+    if progress.get('input') != _inputIdentity(inputFile):
+
+        raise ValueError('The earlier run of {} was on another input file (or {} has changed since), start it afresh '
+                         'without resuming.'.format(progressFile, inputFile))
+
+    return progress
+
+
+def _writeProgress(progressFile, progress):
+    '''
+    Function to atomically write the progress of 'processCSV()' to its progress file.
+
+    Parameters:
+    ----------
+    progressFile: str
+        File path of the progress file.
+    progress: dict
+        Input file, number of completed chunks and rows, and the size of the output file after writing them.
+    '''
+
+    with open(progressFile + '.tmp', 'w') as f:
+
+        json.dump(progress, f)
+
+    os.replace(progressFile + '.tmp', progressFile)
+
+
+def processCSV(inputFile, outputFile, processChunk, textFeature='comment_text', features=None, chunkSize=10000,
+               workers=None, resume=False, **preprocessArgs):
+    '''
+    Function to stream a CSV file in chunks: the texts of each chunk are pre-processed over a process pool, then the
+    chunk and its pre-processed texts are passed to 'processChunk()', and the DataFrame it returns is appended to the
+    output CSV file, in the input order. While a chunk is being processed, the next chunk is pre-processed. An
+    interrupted run can be resumed from its last completed chunk.
+
+    Parameters:
+    ----------
+    inputFile: str
+        File path of the CSV file containing the comment texts, like 'Data/train.csv'.
+    outputFile: str
+        File path of the CSV file to be written.
+    processChunk: function
+        Function taking a chunk (DataFrame) and the list of its pre-processed texts, and returning the DataFrame to be
+        written to the output file.
+    textFeature: str
+        Name of the feature containing the comment texts.
+    features: list
+        Names of the features to be read (including textFeature). None to read all the features.
+    chunkSize: int
+        Number of rows read, pre-processed, processed and written at a time.
+    workers: int
+        Number of worker processes. None to use the number of CPUs.
+    resume: boolean
+        Flag to check whether to continue an interrupted run from its last completed chunk or to start afresh.
+    preprocessArgs:
+        Flags to be passed to the 'preprocess()' function, like html, accent, isBERTUsed etc.
+    '''
+
+    # The progress file records the input file, the completed chunks and the size of the output file after writing
+    # them.
+    progressFile = outputFile + '.progress'
+    progress = _readProgress(progressFile, chunkSize, inputFile) if resume == True else None
+
+    if progress is None:
+
+        progress = {'input': _inputIdentity(inputFile), 'chunkSize': chunkSize, 'chunks': 0, 'rows': 0, 'offset': 0,
+                    'complete': False}
+
+    if progress['complete'] == True:
+
+        return progress
+
+    workers = workers or os.cpu_count() or 1
+
+    # Split the rows of each chunk among the workers.
+    subChunkSize = max(1, -(-chunkSize // workers))
+
+    with futures.ProcessPoolExecutor(max_workers=workers) as executor, open(outputFile, 'ab') as f:
+
+        # Drop the rows written after the last completed chunk (if the earlier run was interrupted while writing).
+        f.truncate(progress['offset'])
+        f.seek(progress['offset'])
+
+        # Chunks being pre-processed, in the input order. At most two chunks are in flight to bound the memory.
+        pending = collections.deque()
+
+        def writeChunk():
+
+            chunk, results = pending.popleft()
+            outputChunk = processChunk(chunk, [preprocessedText for result in results
+                                               for preprocessedText in result.result()])
+
+            data = outputChunk.to_csv(index=False, header=(progress['offset'] == 0)).encode('utf-8')
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+            progress['chunks'] += 1
+            progress['rows'] += len(outputChunk)
+            progress['offset'] += len(data)
+            _writeProgress(progressFile, progress)
+
+        for chunkNumber, chunk in enumerate(pd.read_csv(inputFile, usecols=features, chunksize=chunkSize)):
+
+            # Skip the chunks completed by the earlier run.
+            if chunkNumber < progress['chunks']:
+
+                continue
+
+            texts = chunk[textFeature].tolist()
+            results = [executor.submit(_preprocessTexts, texts, preprocessArgs)
+                       for texts in _splitIntoChunks(texts, subChunkSize)]
+            pending.append((chunk, results))
+
+            if len(pending) > 1:
+
+                writeChunk()
+
+        while pending:
+
+            writeChunk()
+
+    progress['complete'] = True
+    _writeProgress(progressFile, progress)
+
+    return progress
+
+
+def preprocessCSV(inputFile, outputFile, textFeature='comment_text', outputFeature='preprocessed_text', chunkSize=10000,
+                  workers=None, resume=False, **preprocessArgs):
+    '''
+    Function to pre-process the comment texts of a CSV file, streaming it in chunks over a process pool and appending
+    each chunk (along with a new feature containing the pre-processed text) to the output CSV file in the input order.
+
+    Parameters:
+    ----------
+    inputFile: str
+        File path of the CSV file containing the comment texts, like 'Data/train.csv'.
+    outputFile: str
+        File path of the CSV file to be written, like 'Data/preprocessed_train.csv'.
+    textFeature: str
+        Name of the feature containing the comment texts.
+    outputFeature: str
+        Name of the new feature containing the pre-processed comment texts.
+    chunkSize: int
+        Number of rows read, pre-processed and written at a time.
+    workers: int
+        Number of worker processes. None to use the number of CPUs.
+    resume: boolean
+        Flag to check whether to continue an interrupted run from its last completed chunk or to start afresh.
+    preprocessArgs:
+        Flags to be passed to the 'preprocess()' function, like html, accent, isBERTUsed etc.
+    '''
+
+    def addPreprocessedText(chunk, preprocessedTexts):
+
+        chunk[outputFeature] = preprocessedTexts
+
+        return chunk
+
+    return processCSV(inputFile, outputFile, addPreprocessedText, textFeature=textFeature, chunkSize=chunkSize,
+                      workers=workers, resume=resume, **preprocessArgs)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Pre-process the comment texts of a CSV file in parallel.')
+    parser.add_argument('inputFile', help='CSV file containing the comment texts, like Data/train.csv')
+    parser.add_argument('outputFile', help='CSV file to be written, like Data/preprocessed_train.csv')
+    parser.add_argument('--text-feature', dest='textFeature', default='comment_text')
+    parser.add_argument('--output-feature', dest='outputFeature', default='preprocessed_text')
+    parser.add_argument('--chunk-size', dest='chunkSize', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run from its last chunk.')
+    parser.add_argument('--bert', dest='isBERTUsed', action='store_true', help='Pre-process the texts for BERT.')
+    args = parser.parse_args()
+
+    progress = preprocessCSV(args.inputFile, args.outputFile, textFeature=args.textFeature,
+                             outputFeature=args.outputFeature, chunkSize=args.chunkSize, workers=args.workers,
+                             resume=args.resume, isBERTUsed=args.isBERTUsed)
+
+    print('Pre-processed {} rows into {}'.format(progress['rows'], args.outputFile))
@@ -0,0 +1,315 @@
+import os
+import atexit
+import inspect
+import hashlib
+import sqlite3
+import threading
+import collections
+import importlib.metadata
+from custom_utility import contraction_dictionary
+from custom_utility import emoticon_dictionary
+from custom_utility import preprocess_text
+
+# Names and default values of the flags of the 'preprocess()' function, in the order of its signature. The flags are
+# filled with their defaults before hashing, so that preprocess(text) and preprocess(text, html=True) share an entry.
+_flagDefaults = [(name, parameter.default) for name, parameter in
+                 inspect.signature(preprocess_text.preprocess).parameters.items() if name != 'text']
+
+def _preprocessVersion():
+    '''
+    Function to compute the version of the pre-processing: a hash of the source of its modules and of the versions of
+    the packages whose output it depends on, so that the entries of the on-disk tier written by another version of the
+    pre-processing are not served.
+    '''
+
+    digest = hashlib.blake2b(digest_size=8)
+
+    for module in (preprocess_text, emoticon_dictionary, contraction_dictionary):
+
+        with open(module.__file__, 'rb') as f:
+
+            digest.update(f.read())
+
+    for package in ('beautifulsoup4', 'Unidecode'):
+
+        try:
+
+            digest.update(importlib.metadata.version(package).encode('utf-8'))
+
+        except importlib.metadata.PackageNotFoundError:
+
+            digest.update(b'-')
+
+    return digest.hexdigest()
+
+
+# Version of the pre-processing mixed into the keys of the cache.
+preprocessVersion = _preprocessVersion()
+
+
+class PreprocessCache:
+    '''
+    Content-addressed cache of the pre-processed texts, keyed by a hash of the raw text, the flags of 'preprocess()' and
+    the version of the pre-processing.
+    The in-memory tier is bounded by the number of entries and evicts the least recently used entry. The optional
+    on-disk tier is an SQLite database that can be shared by the worker processes. The new entries are written to it in
+    batches (a commit per 'commitEvery' misses, and on 'flush()', 'close()' or the exit of the process) rather than one
+    commit (and fsync) per text.
+
+    Parameters:
+    ----------
+    maxSize: int
+        Maximum number of entries in the in-memory tier.
+    diskFile: str
+        File path of the SQLite database for the on-disk tier. None to keep the cache in memory only.
+    commitEvery: int
+        Number of new entries written to the on-disk tier in a single commit.
+    '''
+
+    def __init__(self, maxSize=100000, diskFile=None, commitEvery=100):
+
+        self.maxSize = maxSize
+        self.diskFile = diskFile
+        self.commitEvery = commitEvery
+        self._entries = collections.OrderedDict()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connectionPid = None
+        self.hits = self.diskHits = self.misses = self.evictions = 0
+
+        if diskFile is not None:
+
+            # Write the pending entries when the process exits.
+            atexit.register(self.close)
+
+    def _key(self, text, flags):
+        '''
+        Function to compute the key of a text and the flags of 'preprocess()'.
+        '''
+
+        flagValues = ''.join('1' if flags.get(name, default) == True else '0' for name, default in _flagDefaults)
+
+        return hashlib.blake2b((preprocessVersion + flagValues + text).encode('utf-8', 'surrogatepass'),
+                               digest_size=16).digest()
+
+    def _disk(self):
+        '''
+        Function to get the connection to the on-disk tier, opened once per process since SQLite connections cannot be
+        shared across forked processes.
+        '''
+
+        if self._connectionPid != os.getpid():
+
+            self._connection = sqlite3.connect(self.diskFile, timeout=30, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            # In WAL mode, a commit only syncs the log at the checkpoints. A crash can lose the last commits, which are
+            # only cache entries.
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS preprocessed (key BLOB PRIMARY KEY, text TEXT)')
+            self._connection.commit()
+            self._connectionPid = os.getpid()
+
+            # The entries pending in the parent process are written by the parent.
+            self._pending = []
+
+        return self._connection
+
+    def _writePending(self):
+        '''
+        Function to write the pending entries to the on-disk tier in a single commit, with the lock held.
+        '''
+
+        if len(self._pending) > 0:
+
+            connection = self._disk()
+            connection.executemany('INSERT OR IGNORE INTO preprocessed VALUES (?, ?)', self._pending)
+            connection.commit()
+            self._pending = []
+
+    def _remember(self, key, preprocessedText):
+        '''
+        Function to add an entry to the in-memory tier, evicting the least recently used entry if it is full.
+        '''
+
+        with self._lock:
+
+            self._entries[key] = preprocessedText
+
+            if len(self._entries) > self.maxSize:
+
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def preprocess(self, text, **flags):
+        '''
+        Function to pre-process the given text, returning the cached result if the same text has already been
+        pre-processed with the same flags.
+
+        Parameters:
+        ----------
+        text: str
+            Text on which the pre-processing has to be performed.
+        flags:
+            Flags to be passed to the 'preprocess()' function, like html, accent, isBERTUsed etc.
+        '''
+
+        # Values that are not text (like NaN) are not cached.
+        if not isinstance(text, str):
+
+            return preprocess_text.preprocess(text, **flags)
+
+        key = self._key(text, flags)
+
+        with self._lock:
+
+            preprocessedText = self._entries.get(key)
+
+            if preprocessedText is not None:
+
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+                return preprocessedText
+
+        if self.diskFile is not None:
+
+            with self._lock:
+
+                row = self._disk().execute('SELECT text FROM preprocessed WHERE key = ?', (key,)).fetchone()
+
+                if row is not None:
+
+                    self.diskHits += 1
+
+            if row is not None:
+
+                self._remember(key, row[0])
+
+                return row[0]
+
+        with self._lock:
+
+            self.misses += 1
+
+        preprocessedText = preprocess_text.preprocess(text, **flags)
+        self._remember(key, preprocessedText)
+
+        if self.diskFile is not None:
+
+            with self._lock:
+
+                self._pending.append((key, preprocessedText))
+
+                if len(self._pending) >= self.commitEvery:
+
+                    self._writePending()
+
+        return preprocessedText
+
+    def flush(self):
+        '''
+        Function to write the pending entries to the on-disk tier.
+        '''
+
+        if self.diskFile is not None:
+
+            with self._lock:
+
+                self._writePending()
+
+    def close(self):
+        '''
+        Function to write the pending entries to the on-disk tier and close the connection of the current process.
+        '''
+
+        self.flush()
+
+        with self._lock:
+
+            if self._connection is not None and self._connectionPid == os.getpid():
+
+                self._connection.close()
+
+            self._connection = None
+            self._connectionPid = None
+
+    def stats(self):
+        '''
+        Function to return the hit, miss and eviction counters of the cache.
+        '''
+
+        return {
+            'size': len(self._entries),
+            'maxSize': self.maxSize,
+            'hits': self.hits,
+            'diskHits': self.diskHits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def clear(self):
+        '''
+        Function to remove all the entries from the in-memory tier and reset the counters.
+        '''
+
+        with self._lock:
+
+            self._entries.clear()
+            self.hits = self.diskHits = self.misses = self.evictions = 0
+
+
+# Process-wide cache used by 'predict.function1()' and the batch pre-processing. It can be configured through the
+# environment variables (inherited by the worker processes) or the 'configure()' function.
+_cache = PreprocessCache(maxSize=int(os.environ.get('PREPROCESS_CACHE_SIZE', 100000)),
+                         diskFile=os.environ.get('PREPROCESS_CACHE_FILE'))
+
+def configure(maxSize=100000, diskFile=None):
+    '''
+    Function to replace the process-wide cache with a new one.
+
+    Parameters:
+    ----------
+    maxSize: int
+        Maximum number of entries in the in-memory tier.
+    diskFile: str
+        File path of the SQLite database for the on-disk tier. None to keep the cache in memory only.
+    '''
+
+    global _cache
+
+    _cache.close()
+    _cache = PreprocessCache(maxSize=maxSize, diskFile=diskFile)
+
+    return _cache
+
+
+def preprocess(text, **flags):
+    '''
+    Function to pre-process the given text through the process-wide cache.
+
+    Parameters:
+    ----------
+    text: str
+        Text on which the pre-processing has to be performed.
+    flags:
+        Flags to be passed to the 'preprocess()' function, like html, accent, isBERTUsed etc.
+    '''
+
+    return _cache.preprocess(text, **flags)
+
+
+def flush():
+    '''
+    Function to write the pending entries of the process-wide cache to its on-disk tier.
+    '''
+
+    _cache.flush()
+
+
+def stats():
+    '''
+    Function to return the hit, miss and eviction counters of the process-wide cache.
+    '''
+
+    return _cache.stats()
@@ -1,12 +1,104 @@
 import re
+import functools
 import unidecode
+import pandas as pd
 from bs4 import BeautifulSoup
 from custom_utility.emoticon_dictionary import emoticonsDict
 from custom_utility.contraction_dictionary import contractionMap
+from custom_utility import instrumentation
 
-def removeHTMLTags(text):
+# region - Compiled Patterns -------------------------------------------------------------------------------------------
+# ----------------------------------------------------------------------------------------------------------------------
+
+# All the patterns used by the pre-processing stages are compiled once at import, so that the per-comment cost does not
+# include the lookups into the regex cache of the 're' module.
+
+# Simple start and end tags (with plain attributes) that the lightweight HTML stripper can remove on its own.
+_simpleTagPattern = re.compile(r'''</[a-zA-Z][a-zA-Z0-9]*\s*>|<([a-zA-Z][a-zA-Z0-9]*)(?:\s+[a-zA-Z_:][-a-zA-Z0-9_:.]*'''
+                               r'''(?:\s*=\s*(?:"[^"<>&]*"|'[^'<>&]*'|[^\s"'=<>`/&]+))?)*\s*/?>''')
+
+# Markup left after removing the simple tags that needs the html parser: a '<' that can start a tag, comment or
+# declaration and a '&' that can start a character reference.
+_complexMarkupPattern = re.compile(r'<(?![\s0-9])|&(?!\s)')
+
+# Tags whose content is not parsed as regular markup (like <script> and <style>) by the html parser, or is left out of
+# 'stripped_strings' (the content of <template> since BeautifulSoup 4.10).
+_rawTextTags = frozenset(['script', 'style', 'textarea', 'title', 'xmp', 'iframe', 'noembed', 'noframes', 'noscript',
+                          'plaintext', 'template'])
+
+# Runs of non-ASCII characters, the only part of a text changed by removing the accents.
+_nonASCIIPattern = re.compile(r'[^\x00-\x7f]+')
+
+# Pattern to collapse the runs of two or more spaces into a single space.
+_multiSpacePattern = re.compile(r'[ ][ ]+')
+
+# Reference: 'Remove IP Address Python' - https://www.geeksforgeeks.org/extract-ip-address-from-file-using-python/#:~:text=The%20regular%20expression%20for%20valid,%5C.)%7B
+_ipAddressRegex = r'((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)'
+_ipAddressPattern = re.compile(_ipAddressRegex)
+
+# Reference: 'Regex for hperlinks Python' - https://www.geeksforgeeks.org/python-check-url-string/
+_hyperlinkPattern = re.compile(r"(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’]))")
+
+_numberPattern = re.compile(r'[0-9]')
+
+# IP Address and number removal fused into a single pass. The scan tries the IP Address first at every position and
+# falls back to a single digit, which finds the same IP Addresses as removing them before the numbers.
+_ipAddressOrNumberPattern = re.compile(_ipAddressRegex + r'|[0-9]')
+
+# Runs of digits and dots starting with a digit. An IP Address always lies within one such run, and since the IP Address
+# pattern has no literal prefix to search for, it is only run over these runs instead of at every position of the text.
+_numberRunPattern = re.compile(r'[0-9][0-9.]*')
+
+_specialCharsPattern = re.compile(r'[^A-Za-z\'.?! ]+') # All special characters except ' . ? !
+_allSpecialCharsPattern = re.compile(r'[^A-Za-z ]+') # All special characters.
+
+# Sentence end markers. These are kept as three patterns with a literal replacement, since a replacement with group
+# references is expanded in Python for every match.
+_exclamationPattern = re.compile(r'[!]+[ ]*[!]*')
+_questionPattern = re.compile(r'[?]+[ ]*[?]*')
+_fullStopPattern = re.compile(r'[.]+[ ]*[.]*')
+
+# Emoticons and their corresponding words (joined by underscore and padded by a space), in the dictionary order.
+_emoticonReplacements = [(emoticon, ' ' + '_'.join(emoticonsDict[emoticon].split()) + ' ') for emoticon in emoticonsDict]
+
+# Characters an emoticon can start with. A text having none of them cannot contain any emoticon.
+_emoticonAlphabet = frozenset(emoticon[0] for emoticon in emoticonsDict)
+
+# Emoticons by their first two characters (or their only character), along with their position in the dictionary order
+# and their replacement.
+_emoticonsByPrefix = dict()
+
+for priority, (emoticon, word) in enumerate(_emoticonReplacements):
+    
+    _emoticonsByPrefix.setdefault(emoticon[:2], list()).append((priority, emoticon, word))
+
+# Pattern matching every character an emoticon can start with, the candidate positions of the emoticons.
+_emoticonStartPattern = re.compile('[' + ''.join(map(re.escape, sorted(_emoticonAlphabet))) + ']')
+
+# The single pass replacement gives the same result as replacing the emoticons one after another only if none of the
+# emoticons can be found inside a replacement; otherwise the emoticons are replaced one after another.
+_emoticonsSinglePass = not any(emoticon in word for emoticon in emoticonsDict for _, word in _emoticonReplacements)
+
+# Contracted words and their decontracted forms, in the dictionary order. The contracted words having an upper case
+# character can never be found in the lowercase text and are left out.
+_contractions = [(word, contractionMap[word]) for word in contractionMap if word == word.lower()]
+
+# Runs of lowercase letters and apostrophes having at least one apostrophe. Every contracted word is such a run and no
+# decontracted form has an apostrophe, so each run can be decontracted independently from the rest of the text.
+_contractionRunPattern = re.compile(r"(?<![a-z'])[a-z]*'[a-z']*")
+
+# The single pass decontraction is used only if the dictionary satisfies the conditions above; otherwise the contracted
+# words are replaced one after another over the whole text.
+_contractionsSinglePass = all(re.fullmatch(r"[a-z']*'[a-z']*", word) for word, _ in _contractions) and \
+                          not any("'" in expandedForm for _, expandedForm in _contractions)
+
+# endregion - Compiled Patterns ----------------------------------------------------------------------------------------
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def _parseHTMLTags(text):
     '''
-    Function to remove the HTML Tags from a given text.
+    Function to remove the HTML Tags from a given text using a BeautifulSoup object.
     
     Parameter:
     ---------
@@ -30,6 +122,80 @@ def removeHTMLTags(text):
     return ' '.join(soup.stripped_strings)
 
 
+def _stripSimpleHTMLTags(text):
+    '''
+    Function to remove the simple HTML Tags from a given text without building a BeautifulSoup object. Returns None if
+    the text has any markup that needs the html parser.
+    
+    Parameter:
+    ---------
+    text: str
+        Text from which the HTML tags has to be removed.
+    '''
+    
+    strings = list() # List to store the text between the tags.
+    position = 0
+    
+    for match in _simpleTagPattern.finditer(text):
+        
+        # The content of <script>, <style> and similar tags is not regular markup.
+        if match.group(1) is not None and match.group(1).lower() in _rawTextTags:
+            
+            return None
+        
+        strings.append(text[position:match.start()])
+        position = match.end()
+        
+    strings.append(text[position:])
+    
+    # Check the text between the tags for any markup left.
+    for string in strings:
+        
+        if _complexMarkupPattern.search(string):
+            
+            return None
+        
+    # Join the stripped non-empty strings the same way as 'stripped_strings' of a BeautifulSoup object.
+    return ' '.join(string for string in map(str.strip, strings) if string)
+
+
+def removeHTMLTags(text):
+    '''
+    Function to remove the HTML Tags from a given text.
+    
+    Parameter:
+    ---------
+    text: str
+        Text from which the HTML tags has to be removed.
+    '''
+    
+    # Fast path for the text without any markup, which the html parser returns as a single string.
+    if '<' not in text and '&' not in text:
+        
+        return text.strip()
+    
+    # Remove the simple inline tags without building a BeautifulSoup object.
+    strippedText = _stripSimpleHTMLTags(text)
+    
+    if strippedText is not None:
+        
+        return strippedText
+    
+    # Parse the <script>/<style> tags, comments, character references and malformed markup with BeautifulSoup.
+    return _parseHTMLTags(text)
+
+
+# 'unidecode()' transliterates each character on its own, so the transliterations of the characters are memoized.
+_transliterateChar = functools.lru_cache(maxsize=65536)(unidecode.unidecode)
+
+def _transliterateRun(match):
+    '''
+    Function to transliterate a run of non-ASCII characters matched by '_nonASCIIPattern'.
+    '''
+    
+    return ''.join(map(_transliterateChar, match.group()))
+
+
 def removeAccentedChars(text):
     '''
     Function to remove the accented characters from a given text.
@@ -42,8 +208,39 @@ def removeAccentedChars(text):
     
     # Reference: "remove accented characters python" - https://www.geeksforgeeks.org/how-to-remove-string-accents-using-python-3/
     
-    # Remove accents
-    return unidecode.unidecode(text)
+    # Fast path for the texts already in ASCII, which have no accents.
+    if text.isascii():
+        
+        return text
+    
+    # Remove accents from the runs of non-ASCII characters only.
+    return _nonASCIIPattern.sub(_transliterateRun, text)
+
+
+def removeAccentedCharsBatch(texts):
+    '''
+    Function to remove the accented characters from a batch of texts. If all the texts are already in ASCII, the given
+    batch is returned as is.
+    
+    Parameter:
+    ---------
+    texts: Series or list
+        Texts from which the accented characters have to be removed.
+    '''
+    
+    # Check the whole batch with a single call, since most of the batches have no accents at all.
+    if ''.join(texts).isascii():
+        
+        return texts
+    
+    accentFreeTexts = [text if text.isascii() else _nonASCIIPattern.sub(_transliterateRun, text) for text in texts]
+    
+    if isinstance(texts, pd.Series):
+        
+        # Keep the index and name of the given Series.
+        return pd.Series(accentFreeTexts, index=texts.index, name=texts.name, dtype=object)
+    
+    return accentFreeTexts
 
 
 def lowercase(text):
@@ -59,9 +256,39 @@ def lowercase(text):
     return text.lower()
 
 
-def removeIPLinkNum(text, ipAddress=True, hyperlink=False, numbers=True):
+def _removeIPAddresses(match):
     '''
-    Function to remove IP Address and Number from the given text.
+    Function to remove the IP Addresses from a run of digits and dots matched by '_numberRunPattern'.
+    '''
+    
+    run = match.group()
+    
+    # An IP Address has three dots.
+    if run.count('.') < 3:
+        
+        return run
+    
+    return _ipAddressPattern.sub('', run)
+
+
+def _removeIPAddressesAndNumbers(match):
+    '''
+    Function to remove the IP Addresses and the numbers from a run of digits and dots matched by '_numberRunPattern'.
+    '''
+    
+    run = match.group()
+    
+    # Without an IP Address, only the dots are left after removing the digits.
+    if run.count('.') < 3:
+        
+        return '.' * run.count('.')
+    
+    return _ipAddressOrNumberPattern.sub('', run)
+
+
+def _stripIPLinkNum(text, ipAddress=True, hyperlink=False, numbers=True):
+    '''
+    Function to remove IP Address, Hyperlink and Number from the given text without removing the extra spaces.
     
     Parameter:
     ---------
@@ -69,47 +296,138 @@ def removeIPLinkNum(text, ipAddress=True, hyperlink=False, numbers=True):
         Text from which IP Address and number(s) have to be removed.
     '''
     
+    # Hyperlinks are removed from the text left after removing the IP Address, so the stages can only be fused without
+    # them.
+    if ipAddress == True and numbers == True and hyperlink == False:
+        
+        return _numberRunPattern.sub(_removeIPAddressesAndNumbers, text)
+    
     # Replace IP Address with empty string.
-    # Reference: 'Remove IP Address Python' - https://www.geeksforgeeks.org/extract-ip-address-from-file-using-python/#:~:text=The%20regular%20expression%20for%20valid,%5C.)%7B
     if ipAddress == True:
         
-        text = re.sub(r'((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)', '', text)
+        text = _numberRunPattern.sub(_removeIPAddresses, text)
     
     # Remove hyperlinks
-    # Reference: 'Regex for hperlinks Python' - https://www.geeksforgeeks.org/python-check-url-string/
     if hyperlink == True:
         
-        text = re.sub(r"(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’]))", "", text)
+        text = _hyperlinkPattern.sub('', text)
     
     # Remove numbers.
     if numbers == True:
         
-        text = re.sub(r'[0-9]', '', text)
+        text = _numberPattern.sub('', text)
+    
+    return text
+
+
+def removeIPLinkNum(text, ipAddress=True, hyperlink=False, numbers=True):
+    '''
+    Function to remove IP Address and Number from the given text.
+    
+    Parameter:
+    ---------
+    text: str
+        Text from which IP Address and number(s) have to be removed.
+    '''
+    
+    text = _stripIPLinkNum(text, ipAddress=ipAddress, hyperlink=hyperlink, numbers=numbers)
     
     # Remove the extra space if any.
-    text = re.sub(r'[ ][ ]+', ' ', text)
+    text = _multiSpacePattern.sub(' ', text)
     
     return text
 
 
-# Replace Emoticons with correponding words
-def replaceEmoticons(text):
+def _substituteEmoticons(text):
+    '''
+    Function to replace the emoticons with their corresponding words without removing the extra spaces.
     
-    for emoticon in emoticonsDict:
+    Parameter:
+    ---------
+    text: str
+        Text in which the emoticons have to be replaced.
+    '''
+    
+    # Fast path for the texts having none of the characters an emoticon starts with.
+    if _emoticonAlphabet.isdisjoint(text):
         
-        word = "_".join(emoticonsDict[emoticon].split())
+        return text
+    
+    if _emoticonsSinglePass == False:
         
-        text = text.replace(emoticon, ' ' + word + ' ')
+        # None of the emoticons contain a space, so the matches do not depend on the extra spaces in between and they
+        # can be removed once at the end instead of after every replacement.
+        for emoticon, word in _emoticonReplacements:
+            
+            text = text.replace(emoticon, word)
         
-        # Remove the extra space if any.
-        text = re.sub(r'[ ][ ]+', ' ', text)
+        return text
+    
+    # Find all the occurrences of all the emoticons (overlapping ones included) in a single scan of the text, checking
+    # the emoticons starting with the one or two characters at each candidate position.
+    occurrences = list()
+    
+    for match in _emoticonStartPattern.finditer(text):
+        
+        start = match.start()
+        prefix = text[start:start + 2]
+        
+        for prefix in (prefix, prefix[0]) if len(prefix) == 2 else (prefix,):
+            
+            for priority, emoticon, word in _emoticonsByPrefix.get(prefix, ()):
+                
+                if text.startswith(emoticon, start):
+                    
+                    occurrences.append((priority, start, start + len(emoticon), word))
+    
+    if not occurrences:
+        
+        return text
+    
+    # Replacing the emoticons one after another in the dictionary order replaces the leftmost occurrences of each
+    # emoticon that do not overlap with the ones already replaced. Since none of the replacements can contain an
+    # emoticon, accepting the occurrences in the same order gives the same replacements.
+    occurrences.sort()
+    replaced = list()
+    occupied = bytearray(len(text)) # Marks the characters of the occurrences already replaced.
+    
+    for priority, start, end, word in occurrences:
+        
+        if occupied.find(1, start, end) < 0:
+            
+            replaced.append((start, end, word))
+            occupied[start:end] = b'\x01' * (end - start)
+    
+    # Stitch the text back together with the replacements in the order of their position.
+    replaced.sort()
+    parts = list()
+    position = 0
+    
+    for start, end, word in replaced:
+        
+        parts.append(text[position:start])
+        parts.append(word)
+        position = end
+    
+    parts.append(text[position:])
+    
+    return ''.join(parts)
+
+
+# Replace Emoticons with correponding words
+def replaceEmoticons(text):
+    
+    text = _substituteEmoticons(text)
+    
+    # Remove the extra space if any.
+    text = _multiSpacePattern.sub(' ', text)
     
     return text
 
 
-def removeSpecialChars(text, removeAll=False):
+def _stripSpecialChars(text, removeAll=False):
     '''
-    Function to remove the special characters from the given text.
+    Function to remove the special characters from the given text without removing the extra spaces.
     
     Parameter:
     ---------
@@ -121,14 +439,27 @@ def removeSpecialChars(text, removeAll=False):
     
     if removeAll == True:
         
-        text = re.sub(r'[^A-Za-z ]+', '', text) # Remove all special characters.
-        
-    else:
+        return _allSpecialCharsPattern.sub('', text) # Remove all special characters.
         
-        text = re.sub(r'[^A-Za-z\'.?! ]+', '', text) # Remove all special characters except ' . ? !
+    return _specialCharsPattern.sub('', text) # Remove all special characters except ' . ? !
+
+
+def removeSpecialChars(text, removeAll=False):
+    '''
+    Function to remove the special characters from the given text.
+    
+    Parameter:
+    ---------
+    text: str
+        Text from which the special characters have to be removed.
+    removeAll: boolean
+        Flag to check whether to remove all special characters or all except ' . ? !
+    '''
+    
+    text = _stripSpecialChars(text, removeAll)
         
     # Remove the extra space if any.
-    text = re.sub(r'[ ][ ]+', ' ', text)
+    text = _multiSpacePattern.sub(' ', text)
     
     return text
 
@@ -147,16 +478,68 @@ def processSpecialTokens(text, isBERTUsed=False):
     
     if (isBERTUsed == False):
     
-        text = re.sub(r'[!]+[ ]*[!]*', ' ! ', text) # Add space around ! with exclmrk.
-        text = re.sub(r'[?]+[ ]*[?]*', ' ? ', text) # Replace ? with qstmrk.
-        text = re.sub(r'[.]+[ ]*[.]*', ' . ', text) # Replace . with eosmkr.
+        # Add space around ! ? and .
+        text = _spaceSpecialTokens(text)
 
         # Remove the extra space if any.
-        text = re.sub(r'[ ][ ]+', ' ', text)
+        text = _removeExtraSpaces(text)
     
     return text
 
 
+def _spaceSpecialTokens(text):
+    '''
+    Function to add one space around sentence end markers and remove duplicates without removing the extra spaces.
+    
+    Parameter:
+    ---------
+    text: str
+        Text in which space has to be added around sentence end tokens.
+    '''
+    
+    text = _exclamationPattern.sub(' ! ', text) # Add space around ! with exclmrk.
+    text = _questionPattern.sub(' ? ', text) # Replace ? with qstmrk.
+    text = _fullStopPattern.sub(' . ', text) # Replace . with eosmkr.
+    
+    return text
+
+
+def _removeExtraSpaces(text):
+    '''
+    Function to collapse the runs of two or more spaces into a single space.
+    
+    Parameter:
+    ---------
+    text: str
+        Text from which the extra spaces have to be removed.
+    '''
+    
+    return _multiSpacePattern.sub(' ', text)
+
+
+@functools.lru_cache(maxsize=65536)
+def _decontractRun(run):
+    '''
+    Function to decontract a run of lowercase letters and apostrophes, the result is cached since the same few runs
+    (don't, it's, i'm, ...) make up most of the contractions in the comments.
+    
+    Parameter:
+    ---------
+    run: str
+        Run of lowercase letters and apostrophes to be decontracted.
+    '''
+    
+    # Replace the contracted words in the dictionary order, so that the overlapping ones (like he'll and he'll've) and
+    # the ones formed by an earlier replacement (like will've) are expanded the same way as over the whole text.
+    for word, expandedForm in _contractions:
+        
+        if word in run:
+            
+            run = run.replace(word, expandedForm)
+    
+    return run
+
+
 def decontract(text, isBERTUsed=False):
     '''
     Function to decontract a given text.
@@ -171,15 +554,59 @@ def decontract(text, isBERTUsed=False):
     
     if isBERTUsed==False:
     
+        # Convert to lowercase. None of the decontracted forms that can be matched in a lowercase text contain an upper
+        # case character, so the text stays lowercase through all the replacements.
+        text = lowercase(text)
+        
+        # Fast path for the texts without any apostrophe, since every contracted word has one.
+        if "'" not in text:
+            
+            return text
+        
+        if _contractionsSinglePass == True:
+            
+            # Decontract each run of lowercase letters and apostrophes in a single scan of the text.
+            return _contractionRunPattern.sub(lambda match: _decontractRun(match.group()), text)
+        
         # Iterate through all the contraction keys and replace the keys with their corresponding values (expanded form)
-        for word in contractionMap.keys():
+        for word, expandedForm in _contractions:
 
-            text = lowercase(text) # Convert to lowercase.
-            text = re.sub(word, contractionMap[word], text) # Replace the contracted word with its decontracted form.
+            text = text.replace(word, expandedForm) # Replace the contracted word with its decontracted form.
         
     return text
 
 
+# Functions implementing the stages of 'preprocess()'. The stages are called through '_stages', which holds either these
+# functions or their timed versions, so that the timing costs nothing unless it is enabled.
+_stageFunctions = {
+    'html': removeHTMLTags,
+    'accent': removeAccentedChars,
+    'lowercase': lowercase,
+    'ipLinkNum': _stripIPLinkNum,
+    'emoticon': _substituteEmoticons,
+    'specialChar': _stripSpecialChars,
+    'specialToken': _spaceSpecialTokens,
+    'extraSpaces': _removeExtraSpaces,
+    'decontraction': decontract
+}
+_stages = dict(_stageFunctions)
+
+def setInstrumentation(enabled=True):
+    '''
+    Function to enable or disable the timing of each stage of 'preprocess()'. The recorded statistics can be read using
+    'instrumentation.getStats()'.
+    
+    Parameter:
+    ---------
+    enabled: boolean
+        Flag to check whether to record the call count, time and change in length of the text for each stage or not.
+    '''
+    
+    for stage, function in _stageFunctions.items():
+        
+        _stages[stage] = instrumentation.timeStage(stage, function) if enabled == True else function
+
+
 def preprocess(text, html=True, accent=True, lower=True, ipLinkNum=True, emoticon=True, specialChar=True, 
                specialToken=True, decontraction=True, isBERTUsed=False, removeAllSpecialChar=False, hyperlink=False):
     '''
@@ -216,41 +643,55 @@ def preprocess(text, html=True, accent=True, lower=True, ipLinkNum=True, emotico
     if html == True:
         
         # Call the function 'removeHTMLTags()' to remove the html tags from the html content
-        text = removeHTMLTags(text)
+        text = _stages['html'](text)
         
     if accent == True:
         
         # Call the function 'removeAccentedChars()' to remove the accented characters from the text.
-        text = removeAccentedChars(text)
+        text = _stages['accent'](text)
         
     if lower == True:
         
         # Call the function 'lowercase()' to convert the text to its lowercase.
-        text = lowercase(text)
+        text = _stages['lowercase'](text)
         
+    # The stages below remove the extra spaces at their end. All of them only match runs of non-space characters or
+    # consume the spaces regardless of their count, so the extra spaces are removed once after the last of them.
+    removeExtraSpaces = False
+    
     if ipLinkNum == True: 
         
-        # Call the 'removeIPLinkNum()' to remove the IP Address, Hyperlinks and numbers from the text.
-        text = removeIPLinkNum(text, hyperlink=hyperlink)
+        # Call the '_stripIPLinkNum()' to remove the IP Address, Hyperlinks and numbers from the text.
+        text = _stages['ipLinkNum'](text, hyperlink=hyperlink)
+        removeExtraSpaces = True
         
     if emoticon == True:
         
-        # Call the 'replaceEmoticons()' to replace emoticons by their corresponding words.
-        text = replaceEmoticons(text)
+        # Call the '_substituteEmoticons()' to replace emoticons by their corresponding words.
+        text = _stages['emoticon'](text)
+        removeExtraSpaces = True
         
     if specialChar == True:
         
-        # Call the 'removeSpecialChars()' to remove the special characters from a text.
-        text = removeSpecialChars(text, removeAllSpecialChar)
+        # Call the '_stripSpecialChars()' to remove the special characters from a text.
+        text = _stages['specialChar'](text, removeAllSpecialChar)
+        removeExtraSpaces = True
         
-    if specialToken == True:
+    if specialToken == True and isBERTUsed == False:
         
-        # Call the 'processSpecialTokens' to add space around sentence end tokens.
-        text = processSpecialTokens(text, isBERTUsed)
+        # Add space around sentence end tokens.
+        text = _stages['specialToken'](text)
+        removeExtraSpaces = True
+        
+    if removeExtraSpaces == True:
+        
+        # Remove the extra space if any.
+        text = _stages['extraSpaces'](text)
         
     if decontraction == True:
         
-        # Call the 'decontract()' function to decontract a given text. 
-        text = decontract(text, isBERTUsed)
+        # Call the 'decontract()' function to decontract a given text. Decontraction neither adds nor matches the
+        # spaces, so it can run after the extra spaces are removed.
+        text = _stages['decontraction'](text, isBERTUsed)
         
     return text
\ No newline at end of file
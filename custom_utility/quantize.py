@@ -0,0 +1,214 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from tensorflow.keras import models
+from custom_utility import export_model
+from custom_utility import inference
+from custom_utility import performance_metrics
+from custom_utility import registry
+from custom_utility import tokenize
+
+# Identity subgroups used by the bias metrics of the competition.
+identitySubgroups = ['male', 'female', 'homosexual_gay_or_lesbian', 'christian', 'jewish', 'muslim', 'black', 'white',
+                     'psychiatric_or_mental_illness']
+
+# Quantization modes of 'convertToTFLite()'.
+quantizationModes = ('none', 'dynamic', 'float16', 'int8')
+
+def readSample(dataFile, sampleSize, features, randomState=42):
+    '''
+    Function to read a random sample of the rows of a CSV file, like 'Data/preprocessed_train.csv'.
+
+    Parameters:
+    ----------
+    dataFile: str
+        File path of the CSV file.
+    sampleSize: int
+        Number of rows in the sample. None to read all the rows.
+    features: list
+        Names of the features to be read.
+    randomState: int
+        Seed of the random sample.
+    '''
+
+    data = pd.read_csv(dataFile, usecols=features)
+
+    if sampleSize is not None and sampleSize < len(data):
+
+        data = data.sample(n=sampleSize, random_state=randomState).reset_index(drop=True)
+
+    return data
+
+
+def convertToTFLite(modelFile, outputFile, quantization='dynamic', calibrationText=None):
+    '''
+    Function to convert a pre-trained model into a TensorFlow Lite model computing only its toxicity output.
+
+    Parameters:
+    ----------
+    modelFile: str
+        File path of the pre-trained model, like 'BestModels/modelBiLSTM.h5'.
+    outputFile: str
+        File path of the TensorFlow Lite model to be written, like 'BestModels/modelBiLSTM_dynamic.tflite'.
+    quantization: str
+        'none' to keep the float32 weights, 'dynamic' for the dynamic-range (int8 weights) quantization, 'float16' for
+        the float16 weights, or 'int8' for the full integer quantization of the weights and activations.
+    calibrationText: numpy.ndarray
+        Padded texts whose activations calibrate the 'int8' quantization, like a sample of 'preprocessed_train.csv'.
+    '''
+
+    if quantization not in quantizationModes:
+
+        raise ValueError('Quantization must be one of {}.'.format(', '.join(quantizationModes)))
+
+    if quantization == 'int8' and calibrationText is None:
+
+        raise ValueError('The int8 quantization needs the calibration texts.')
+
+    model = export_model.buildInferenceModel(models.load_model(modelFile, compile=False))
+    inputDtype = model.inputs[0].dtype
+
+    # The LSTM layers are converted into the fused TensorFlow Lite kernels only for a static batch size.
+    concreteFunction = tf.function(lambda paddedText: model(paddedText, training=False)).get_concrete_function(
+        tf.TensorSpec(shape=(1, model.inputs[0].shape[1]), dtype=inputDtype))
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([concreteFunction], model)
+
+    if quantization != 'none':
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantization == 'float16':
+
+        converter.target_spec.supported_types = [tf.float16]
+
+    if quantization == 'int8':
+
+        # The input (ids) and output (probability) stay float, only the computation inside the model is quantized.
+        converter.representative_dataset = lambda: ([paddedText[np.newaxis].astype(inputDtype.as_numpy_dtype)]
+                                                    for paddedText in calibrationText)
+
+    with open(outputFile, 'wb') as f:
+
+        f.write(converter.convert())
+
+
+def _scoreAndTime(runner, paddedText):
+    '''
+    Function to predict the toxicity scores of the padded texts and measure the mean time per text (milliseconds).
+    '''
+
+    start = time.perf_counter()
+    yPredProb = runner.predictProba(paddedText)
+
+    return yPredProb, 1e3 * (time.perf_counter() - start) / max(len(paddedText), 1)
+
+
+def quantizationReport(modelFile, tfliteFile, evaluationFile, tokenizerFile, seqLen=210, sampleSize=20000,
+                       textFeature='preprocessed_text', actualClassLabel='target', subgroups=identitySubgroups):
+    '''
+    Function to compare the float model and its TensorFlow Lite model on a labelled sample (like a sample of
+    'Data/preprocessed_train.csv'), and return a DataFrame with the overall AUC, the final metric of the competition,
+    the latency and the file size of each, along with the differences of their scores.
+
+    Parameters:
+    ----------
+    modelFile: str
+        File path of the pre-trained model.
+    tfliteFile: str
+        File path of the TensorFlow Lite model converted from it.
+    evaluationFile: str
+        File path of the CSV file containing the pre-processed comment texts, the class label and identity subgroups.
+    tokenizerFile: str
+        File path of the tokenizer object.
+    seqLen: int
+        Maximum sequence length of the comment texts.
+    sampleSize: int
+        Number of rows of the CSV file to evaluate on. None to evaluate on all the rows.
+    textFeature: str
+        Name of the feature containing the pre-processed comment texts.
+    actualClassLabel: str
+        Name of the class label (toxicity score).
+    subgroups: list
+        Names of the identity subgroups.
+    '''
+
+    data = readSample(evaluationFile, sampleSize, [textFeature, actualClassLabel] + list(subgroups))
+
+    # Binary class label and identity subgroups, in the same way as the modelling notebooks.
+    data[actualClassLabel] = data[actualClassLabel] >= 0.5
+
+    for subgroup in subgroups:
+
+        data[subgroup] = data[subgroup].fillna(0) >= 0.5
+
+    paddedText = tokenize.encodeAndPad(data[textFeature].fillna(''), registry.loadTokenizer(tokenizerFile), seqLen)
+
+    runners = {
+        'float': inference.InferenceRunner(models.load_model(modelFile, compile=False), maxSeqLen=seqLen),
+        'tflite': inference.TFLiteRunner(tfliteFile)
+    }
+
+    report = dict()
+
+    for name, runner in runners.items():
+
+        yPredProb, latency = _scoreAndTime(runner, paddedText)
+        data[name] = yPredProb
+
+        biasMetrics = performance_metrics.computeBiasMetricsForModel(data=data, subgroups=subgroups,
+                                                                     predClassLabel=name,
+                                                                     actualClassLabel=actualClassLabel)
+        overallAUC = performance_metrics.computeOverallAUC(data=data, actualClassLabel=actualClassLabel,
+                                                           predClassLabel=name)
+
+        report[name] = {
+            'modelFile': modelFile if name == 'float' else tfliteFile,
+            'fileBytes': os.path.getsize(modelFile if name == 'float' else tfliteFile),
+            'overallAUC': overallAUC,
+            'finalMetric': performance_metrics.computeFinalMetric(biasMetrics, overallAUC),
+            'millisecondsPerText': latency
+        }
+
+    difference = (data['tflite'] - data['float']).abs()
+    report['tflite']['maxScoreDifference'] = difference.max()
+    report['tflite']['meanScoreDifference'] = difference.mean()
+    report['tflite']['toxicChanged'] = int(((data['tflite'] >= 0.5) != (data['float'] >= 0.5)).sum())
+
+    return pd.DataFrame(report).T
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Convert a pre-trained model into a quantized TensorFlow Lite model.')
+    parser.add_argument('modelFile', help='Pre-trained model, like BestModels/modelBiLSTM.h5')
+    parser.add_argument('--quantization', choices=quantizationModes, default='dynamic')
+    parser.add_argument('--data', dest='dataFile', default='Data/preprocessed_train.csv',
+                        help='Pre-processed comment texts for the calibration and the report.')
+    parser.add_argument('--tokenizer', dest='tokenizerFile', default='Resources/tokenizer.pkl')
+    parser.add_argument('--seq-len', dest='seqLen', type=int, default=210)
+    parser.add_argument('--calibration-size', dest='calibrationSize', type=int, default=500)
+    parser.add_argument('--report-size', dest='reportSize', type=int, default=20000)
+    parser.add_argument('--no-report', dest='report', action='store_false')
+    args = parser.parse_args()
+
+    outputFile = os.path.splitext(args.modelFile)[0] + '_' + args.quantization + '.tflite'
+    calibrationText = None
+
+    if args.quantization == 'int8':
+
+        # Calibrate on a different sample than the one of the report.
+        calibrationData = readSample(args.dataFile, args.calibrationSize, ['preprocessed_text'], randomState=0)
+        calibrationText = tokenize.encodeAndPad(calibrationData['preprocessed_text'].fillna(''),
+                                                registry.loadTokenizer(args.tokenizerFile), args.seqLen)
+
+    convertToTFLite(args.modelFile, outputFile, quantization=args.quantization, calibrationText=calibrationText)
+    print('Converted {} into {}'.format(args.modelFile, outputFile))
+
+    if args.report == True:
+
+        print(quantizationReport(args.modelFile, outputFile, args.dataFile, args.tokenizerFile, seqLen=args.seqLen,
+                                 sampleSize=args.reportSize).to_string())
@@ -0,0 +1,316 @@
+import re
+import json
+import mmap
+import zlib
+import pickle
+import struct
+import argparse
+import numpy as np
+
+# Layout of a vocabulary file (all the integers are little-endian):
+#   magic (8 bytes) | header length (uint32) | JSON header | padding to 8 bytes |
+#   offsets (uint32[count + 1]) | ids (int32[count]) | hash slots (int32[tableSize]) | UTF-8 strings of the words
+# The words are stored sorted by their UTF-8 bytes, 'offsets' delimits each word in the strings and 'ids' holds its
+# integer id. The hash slots hold the position of a word in the sorted table (-1 for an empty slot), addressed by the
+# CRC-32 of its UTF-8 bytes with linear probing.
+_magic = b'CUVOCAB1'
+
+def _encodeWord(word):
+    '''
+    Function to convert a word into the bytes stored in the vocabulary file.
+    '''
+
+    return word.encode('utf-8', 'surrogatepass')
+
+
+def exportVocabulary(tokenizerObjFile, vocabularyFile):
+    '''
+    Function to convert a pickled Keras tokenizer into a compact vocabulary file that can be memory-mapped and shared by
+    all the processes on a host. Only the words that 'texts_to_sequences()' of the tokenizer can output are kept, with
+    the id it outputs for them (the words beyond 'num_words' are mapped to the OOV token like the unknown words).
+
+    Parameters:
+    ----------
+    tokenizerObjFile: str
+        File path containing the tokenizer object, like 'Resources/tokenizer.pkl'.
+    vocabularyFile: str
+        File path of the vocabulary file to be written, like 'Resources/tokenizer.vocab'.
+    '''
+
+    with open(tokenizerObjFile, 'rb') as f:
+
+        tokenizer = pickle.load(f)
+
+    if tokenizer.analyzer is not None:
+
+        raise ValueError('A tokenizer with a custom analyzer cannot be exported.')
+
+    numWords = tokenizer.num_words
+    oovIndex = tokenizer.word_index.get(tokenizer.oov_token)
+
+    words = sorted((_encodeWord(word), index) for word, index in tokenizer.word_index.items()
+                   if not numWords or index < numWords)
+
+    # Power of two with at most 50% load, so that the probe sequences stay short.
+    tableSize = 1 << max(1, (2 * len(words) - 1).bit_length())
+    slots = np.full(tableSize, -1, dtype='<i4')
+
+    for position, (word, _) in enumerate(words):
+
+        slot = zlib.crc32(word) & (tableSize - 1)
+
+        while slots[slot] != -1:
+
+            slot = (slot + 1) & (tableSize - 1)
+
+        slots[slot] = position
+
+    offsets = np.zeros(len(words) + 1, dtype='<u4')
+    offsets[1:] = np.cumsum([len(word) for word, _ in words])
+    ids = np.array([index for _, index in words], dtype='<i4')
+
+    header = json.dumps({
+        'count': len(words),
+        'tableSize': tableSize,
+        'unknownId': oovIndex if tokenizer.oov_token is not None and oovIndex is not None else -1,
+        'lower': bool(tokenizer.lower),
+        'charLevel': bool(tokenizer.char_level),
+        'filters': tokenizer.filters,
+        'split': tokenizer.split
+    }).encode('utf-8')
+
+    with open(vocabularyFile, 'wb') as f:
+
+        f.write(_magic + struct.pack('<I', len(header)) + header)
+        f.write(b'\0' * (-f.tell() % 8))
+        f.write(offsets.tobytes())
+        f.write(ids.tobytes())
+        f.write(slots.tobytes())
+        f.write(b''.join(word for word, _ in words))
+
+
+def isVocabularyFile(filePath):
+    '''
+    Function to check whether the given file is a vocabulary file written by 'exportVocabulary()'.
+
+    Parameters:
+    ----------
+    filePath: str
+        File path to be checked.
+    '''
+
+    with open(filePath, 'rb') as f:
+
+        return f.read(len(_magic)) == _magic
+
+
+class Vocabulary:
+    '''
+    Read-only vocabulary memory-mapped from a file written by 'exportVocabulary()'. Its 'texts_to_sequences()' gives the
+    same integer ids as the Keras tokenizer it was exported from, so it can be used in place of the tokenizer object.
+    The pages of the file are shared by all the processes mapping it, instead of each process holding its own copy of
+    the dictionaries of the tokenizer.
+
+    Parameters:
+    ----------
+    vocabularyFile: str
+        File path of the vocabulary file.
+    cacheSize: int
+        Number of the most recently looked up words kept in a per-process cache.
+    '''
+
+    def __init__(self, vocabularyFile, cacheSize=65536):
+
+        with open(vocabularyFile, 'rb') as f:
+
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(_magic)] != _magic:
+
+            raise ValueError('{} is not a vocabulary file.'.format(vocabularyFile))
+
+        headerLength, = struct.unpack_from('<I', self._map, len(_magic))
+        headerEnd = len(_magic) + 4 + headerLength
+        header = json.loads(self._map[len(_magic) + 4:headerEnd].decode('utf-8'))
+
+        self.vocabularyFile = vocabularyFile
+        self.count = header['count']
+        self.unknownId = header['unknownId']
+        self.lower = header['lower']
+        self.charLevel = header['charLevel']
+        self.split = header['split']
+        self._filterMap = str.maketrans({character: header['split'] for character in header['filters']})
+
+        # With a single character separator, the words are the runs of the characters that are neither filtered nor the
+        # separator, which a regex finds in one pass instead of translating and splitting the text.
+        self._wordPattern = None
+
+        if len(self.split) == 1:
+
+            self._wordPattern = re.compile('[^{}]+'.format(re.escape(header['filters'] + self.split)))
+        self._mask = header['tableSize'] - 1
+
+        view = memoryview(self._map)
+        start = headerEnd + (-headerEnd % 8)
+        self._offsets = view[start:start + 4 * (self.count + 1)].cast('I')
+        start += 4 * (self.count + 1)
+        self._ids = view[start:start + 4 * self.count].cast('i')
+        start += 4 * self.count
+        self._slots = view[start:start + 4 * header['tableSize']].cast('i')
+        self._stringsStart = start + 4 * header['tableSize']
+
+        # Ids of the words looked up so far. It stops growing once full, which keeps the most frequent words since they
+        # are the first ones to be looked up.
+        self.cacheSize = cacheSize
+        self._cache = dict()
+
+    def __len__(self):
+
+        return self.count
+
+    def lookup(self, word):
+        '''
+        Function to return the id of a word, or 'unknownId' if the word is not in the vocabulary.
+
+        Parameters:
+        ----------
+        word: str
+            Word to be looked up.
+        '''
+
+        index = self._cache.get(word)
+
+        if index is None:
+
+            index = self._probe(word)
+
+            if len(self._cache) < self.cacheSize:
+
+                self._cache[word] = index
+
+        return index
+
+    def _probe(self, word):
+        '''
+        Function to look up a word in the hash slots of the vocabulary file.
+        '''
+
+        encodedWord = _encodeWord(word)
+        slot = zlib.crc32(encodedWord) & self._mask
+
+        while True:
+
+            position = self._slots[slot]
+
+            if position == -1:
+
+                return self.unknownId
+
+            start = self._stringsStart + self._offsets[position]
+            end = self._stringsStart + self._offsets[position + 1]
+
+            if end - start == len(encodedWord) and self._map[start:end] == encodedWord:
+
+                return self._ids[position]
+
+            slot = (slot + 1) & self._mask
+
+    def textToWords(self, text):
+        '''
+        Function to split a text into the words looked up in the vocabulary, in the same way as the Keras tokenizer.
+
+        Parameters:
+        ----------
+        text: str or list
+            Text, or list of its words.
+        '''
+
+        if self.charLevel or isinstance(text, list):
+
+            if self.lower:
+
+                text = [word.lower() for word in text] if isinstance(text, list) else text.lower()
+
+            return text
+
+        if self.lower:
+
+            text = text.lower()
+
+        if self._wordPattern is not None:
+
+            return self._wordPattern.findall(text)
+
+        return [word for word in text.translate(self._filterMap).split(self.split) if word]
+
+    def texts_to_sequences_generator(self, texts):
+        '''
+        Function to yield the list of the integer ids of each text, as 'texts_to_sequences_generator()' of the Keras
+        tokenizer does.
+
+        Parameters:
+        ----------
+        texts: list or Series
+            Texts to be converted.
+        '''
+
+        # The ids are never 0, so a cache miss is the only falsy result of 'get()'.
+        cached = self._cache.get
+        lookup = self.lookup
+
+        for text in texts:
+
+            ids = [cached(word) or lookup(word) for word in self.textToWords(text)]
+
+            yield [index for index in ids if index != -1] if self.unknownId == -1 else ids
+
+    def texts_to_sequences(self, texts):
+        '''
+        Function to convert the texts into the lists of their integer ids, as 'texts_to_sequences()' of the Keras
+        tokenizer does.
+
+        Parameters:
+        ----------
+        texts: list or Series
+            Texts to be converted.
+        '''
+
+        return list(self.texts_to_sequences_generator(texts))
+
+
+def verifyVocabulary(tokenizerObjFile, vocabularyFile, texts):
+    '''
+    Function to compare the integer encoding of the texts by the pickled tokenizer and the exported vocabulary, and
+    return the list of the positions of the texts for which they differ (empty if they agree on all the texts).
+
+    Parameters:
+    ----------
+    tokenizerObjFile: str
+        File path containing the tokenizer object.
+    vocabularyFile: str
+        File path of the vocabulary file exported from the tokenizer.
+    texts: list or Series
+        Texts to be compared, like a sample of the pre-processed comment texts.
+    '''
+
+    with open(tokenizerObjFile, 'rb') as f:
+
+        tokenizer = pickle.load(f)
+
+    texts = list(texts)
+    expected = tokenizer.texts_to_sequences(texts)
+    actual = Vocabulary(vocabularyFile).texts_to_sequences(texts)
+
+    return [position for position, (x, y) in enumerate(zip(expected, actual)) if x != y]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Export a pickled Keras tokenizer into a memory-mappable vocabulary.')
+    parser.add_argument('tokenizerObjFile', help='Pickled tokenizer, like Resources/tokenizer.pkl')
+    parser.add_argument('vocabularyFile', help='Vocabulary file to be written, like Resources/tokenizer.vocab')
+    args = parser.parse_args()
+
+    exportVocabulary(args.tokenizerObjFile, args.vocabularyFile)
+
+    print('Exported {} words into {}'.format(len(Vocabulary(args.vocabularyFile)), args.vocabularyFile))
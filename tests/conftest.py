@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tests import the 'custom_utility' package from the root of the repository, like the notebooks do.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
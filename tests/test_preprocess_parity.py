@@ -0,0 +1,83 @@
+import random
+import itertools
+import pytest
+from custom_utility import preprocess_text
+import baseline_preprocess_text
+
+# Flags of 'preprocess()', each test runs one combination of them.
+_flagNames = ['html', 'accent', 'lower', 'ipLinkNum', 'emoticon', 'specialChar', 'specialToken', 'decontraction',
+              'isBERTUsed', 'removeAllSpecialChar', 'hyperlink']
+
+# Texts covering the fast paths and their fallbacks: markup handled by the html parser, non-ASCII text, IP addresses
+# and numbers, hyperlinks, adjacent emoticons, contractions and runs of the sentence end markers.
+_edgeCases = [
+    '',
+    '   ',
+    'Plain text, nothing to strip.',
+    '  Leading and trailing spaces\t\n',
+    '<b>Bold</b> and <i class="x">italic</i> text<br/>',
+    '<p>Para</p><script>var x = 1;</script><style>p {}</style> after',
+    '<template>hidden</template> shown <TEMPLATE id="t">hidden too</TEMPLATE>',
+    'a &amp; b &lt; c <!-- comment --> &#169; &copy d',
+    'x < y and 3 > 2 & more',
+    '<textarea><b>raw</b></textarea> <title>Title</title>',
+    'Café naïve coöperate Straße ΣΊΣΥΦΟΣ İstanbul ﬁne',
+    'IP 192.168.0.1 and 256.1.1.1 and 10.0.0.255.7 phone 555-1234',
+    'Visit http://example.com/path?q=1 or www.test.org/page and (https://a.b/c(d)).',
+    'Happy :) sad :( wink ;) laugh :D:P <3 :-)',
+    "I can't, you won't, they're, we'll, he's, Y'ALL'D'VE, ain't",
+    "CAN'T WON'T Don't",
+    'Really?!?! Wow!!! ... Hmm.. ok . . . ?? !',
+    'multiple     spaces   and\ttabs\nnewlines',
+    "quotes 'single' \"double\" `back` and emoji 😀🔥",
+]
+
+# Fragments of the random texts, mixing all the cases above.
+_fragments = ['you', 'are', 'an', 'IDIOT', "can't", "won't", "it's", 'really', '!!!', '??', '...', ':)', ':(', ';)',
+              '<b>', '</b>', '<i>', '</i>', '&amp;', '<br>', 'café', 'naïve', 'http://x.com/a', 'www.y.org/b',
+              '192.168.1.1', '42', '3.14', '  ', '\t', 'Hello', 'WORLD', '"quoted"', '<script>x</script>', '#tag',
+              '@user', '-', '_', 'ÉCOLE', 'ß']
+
+def _corpus():
+    '''
+    Function to return the texts the outputs are compared on: the edge cases and random texts.
+    '''
+
+    rng = random.Random(0)
+    randomTexts = [' '.join(rng.choice(_fragments) for _ in range(rng.randint(1, 25))) for _ in range(12)]
+
+    return _edgeCases + randomTexts
+
+
+_texts = _corpus()
+
+@pytest.mark.parametrize('flagValues', list(itertools.product([True, False], repeat=len(_flagNames))),
+                         ids=lambda flagValues: ''.join('1' if value else '0' for value in flagValues))
+def test_preprocessMatchesBaseline(flagValues):
+
+    flags = dict(zip(_flagNames, flagValues))
+
+    for text in _texts:
+
+        assert preprocess_text.preprocess(text, **flags) == baseline_preprocess_text.preprocess(text, **flags), text
+
+
+@pytest.mark.parametrize('text', _texts)
+def test_stagesMatchBaseline(text):
+
+    assert preprocess_text.removeHTMLTags(text) == baseline_preprocess_text.removeHTMLTags(text)
+    assert preprocess_text.removeAccentedChars(text) == baseline_preprocess_text.removeAccentedChars(text)
+    assert preprocess_text.replaceEmoticons(text) == baseline_preprocess_text.replaceEmoticons(text)
+    assert preprocess_text.decontract(text) == baseline_preprocess_text.decontract(text)
+
+    for hyperlink in (True, False):
+
+        assert (preprocess_text.removeIPLinkNum(text, hyperlink=hyperlink) ==
+                baseline_preprocess_text.removeIPLinkNum(text, hyperlink=hyperlink))
+
+    for removeAll in (True, False):
+
+        assert (preprocess_text.removeSpecialChars(text, removeAll) ==
+                baseline_preprocess_text.removeSpecialChars(text, removeAll))
+        assert (preprocess_text.processSpecialTokens(text, removeAll) ==
+                baseline_preprocess_text.processSpecialTokens(text, removeAll))
@@ -0,0 +1,68 @@
+import pickle
+import numpy as np
+import pytest
+from custom_utility import tokenize
+from custom_utility import vocabulary
+
+tf = pytest.importorskip('tensorflow')
+
+from tensorflow.keras.preprocessing.sequence import pad_sequences
+from tensorflow.keras.preprocessing.text import Tokenizer
+
+_trainTexts = ['you are an idiot', 'You are GREAT!', 'what a great, great day', 'an idiot wrote this... again',
+               'naïve café owners', 'tabs\tand\nnewlines', 'the the the the quick brown fox']
+
+# Texts with unseen words, other cases, filtered characters and texts longer than the padded length.
+_texts = _trainTexts + ['', '   ', 'unseen words only', 'YOU ARE AN IDIOT!!!', 'great; idiot: fox?', 'café-owners',
+                        ' '.join(['great'] * 30 + ['idiot'] * 30), 'the quick brown fox jumps over the idiot']
+
+# Configurations of the tokenizer, like the one of the modelling notebooks (no OOV token, no limit on the words).
+_tokenizerArgs = [dict(), dict(oov_token='<unk>'), dict(num_words=6), dict(num_words=6, oov_token='<unk>'),
+                  dict(lower=False), dict(filters=''), dict(split='\t')]
+
+@pytest.fixture(params=_tokenizerArgs, ids=lambda tokenizerArgs: repr(tokenizerArgs))
+def tokenizers(request, tmp_path):
+    '''
+    Fixture returning a fitted Keras tokenizer and the vocabulary exported from it.
+    '''
+
+    tokenizer = Tokenizer(**request.param)
+    tokenizer.fit_on_texts(_trainTexts)
+
+    tokenizerFile = str(tmp_path / 'tokenizer.pkl')
+    vocabularyFile = str(tmp_path / 'tokenizer.vocab')
+
+    with open(tokenizerFile, 'wb') as f:
+
+        pickle.dump(tokenizer, f)
+
+    vocabulary.exportVocabulary(tokenizerFile, vocabularyFile)
+
+    return tokenizer, vocabulary.Vocabulary(vocabularyFile)
+
+
+def test_vocabularyMatchesTokenizer(tokenizers):
+
+    tokenizer, vocab = tokenizers
+
+    assert vocab.texts_to_sequences(_texts) == tokenizer.texts_to_sequences(_texts)
+
+
+@pytest.mark.parametrize('maxLen', [1, 5, 50])
+@pytest.mark.parametrize('padding', ['pre', 'post'])
+@pytest.mark.parametrize('truncating', ['pre', 'post'])
+def test_encodeAndPadMatchesKeras(tokenizers, maxLen, padding, truncating):
+
+    tokenizer, vocab = tokenizers
+    expected = pad_sequences(tokenizer.texts_to_sequences(_texts), maxlen=maxLen, padding=padding,
+                             truncating=truncating)
+
+    for tokenizerObj in (tokenizer, vocab):
+
+        for reuseBuffer in (False, True):
+
+            paddedTexts = tokenize.encodeAndPad(_texts, tokenizerObj, maxLen, padding=padding, truncating=truncating,
+                                                reuseBuffer=reuseBuffer)
+
+            assert paddedTexts.dtype == np.int32
+            np.testing.assert_array_equal(paddedTexts, expected)